@@ -1,3 +1,4 @@
+import asyncio
 import json
 import logging
 import os
@@ -6,16 +7,24 @@ import string
 from contextlib import asynccontextmanager
 from io import BytesIO
 import subprocess
-from typing import Set, Optional
+from typing import Optional
 from urllib import request
 from PIL import Image
 from fastapi import FastAPI, Depends, Header, WebSocket, WebSocketDisconnect, HTTPException, UploadFile, File, Form
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
-from app.backend.database import SessionLocal, init_db, get_db
+from app.backend.backplane import create_backplane
+from app.backend.batching import ChannelBatcher
+from app.backend.channel_feed import CHANNEL_DIFF_WINDOW_MS, as_change, changes_since, coalesce, record_change
+from app.backend.cache import as_row, channel_key, direct_key, hot_tier
+from app.backend.codec import Frame, channel_post_frame, decode, mux_frame, negotiate, realtime_frame
+from app.backend.connections import HEARTBEAT_INTERVAL, Connection, ConnectionManager, connection_stats
+from app.backend.database import SessionLocal, init_db, get_db, run_db
 from app.backend.models import User, DirectMessage, Channel, ChannelMessage, UserChannel, Image as ImageModel, Video as VideoModel
+from app.backend.writer import message_writer
 from app.backend.schemas import ChannelResponse, UserCreate, DirectMessageCreate, ChannelCreate, ChannelMessageCreate
 from typing import List
 
@@ -29,7 +38,22 @@ os.makedirs(video_dir, exist_ok=True)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()
+    backplane.start(asyncio.get_running_loop())
+    heartbeat_task = asyncio.create_task(heartbeat())
     yield
+    heartbeat_task.cancel()
+    backplane.stop()
+    message_writer.stop()
+
+
+async def heartbeat():
+    """Pings quiet sockets and reaps dead or idle ones every HEARTBEAT_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        try:
+            manager.sweep()
+        except Exception as e:
+            print(f"[ERROR] Heartbeat sweep failed: {e}")
 
 app = FastAPI(
     lifespan=lifespan,
@@ -48,8 +72,6 @@ app.mount(
     name="videos"
 )
 
-active_connections = {}
-
 # CORS Middleware
 app.add_middleware(
     CORSMiddleware,
@@ -67,50 +89,169 @@ def get_db():
     finally:
         db.close()
 
-channel_connections = {}
+# every realtime connection held by this worker, indexed by user, channel and socket
+manager = ConnectionManager()
+
+
+def member_channel_ids(db: Session, user_id: int) -> set:
+    """Channels whose events a user's personal connections should receive."""
+    memberships = db.query(UserChannel.channel_id).filter(UserChannel.user_id == user_id).all()
+    return {channel_id for (channel_id,) in memberships}
+
+
+def count_users(db: Session, user_ids: set) -> int:
+    return db.query(User.id).filter(User.id.in_(user_ids)).count()
+
+
+def is_member(db: Session, user_id: int, channel_id: int) -> bool:
+    return db.query(UserChannel).filter_by(user_id=user_id, channel_id=channel_id).first() is not None
+
+
+def can_view_channel(db: Session, user_id: int, channel_id: int) -> bool:
+    """Public channels are open to everyone, private ones to their members."""
+    channel = db.get(Channel, channel_id)
+    return channel is not None and (channel.is_public or is_member(db, user_id, channel_id))
+
+
+def deliver_local(event: dict):
+    """Backplane handler: applies an event to the connections held by this worker."""
+    control = event.get("control")
+    if control == "subscribe":
+        manager.subscribe(event["user_id"], event["channel_id"])
+        return
+    if control == "unsubscribe":
+        manager.unsubscribe(event["user_id"], event["channel_id"])
+        return
+    if control == "channel_deleted":
+        manager.drop_channel(event["channel_id"])
+        hot_tier.drop(channel_key(event["channel_id"]))
+        return
+    if control == "history_append":
+        hot_tier.append(event["row"])
+        return
+    if control == "history_remove":
+        hot_tier.remove(tuple(event["key"]), event["message_id"])
+        return
+    if control == "delivery_mode":
+        batcher.set_mode(event["channel_id"], event["batched"])
+        return
+
+    payload = event["payload"]
+    if isinstance(payload, dict) and payload.get("event") == "channel_change":
+        channel_list.add(CHANNEL_LIST, payload)
+        return
+
+    targets = event["targets"]
+    batched = [key for kind, key in targets if kind == "channel" and batcher.is_batched(key)]
+    skip = set()
+    if batched:
+        # members of a batched channel get this event in the channel's next batch frame
+        skip = manager.recipients([("channel", key) for key in batched])
+        for key in batched:
+            batcher.add(key, event["payload"])
+        targets = [(kind, key) for kind, key in targets if not (kind == "channel" and key in batched)]
+
+    # encoded once per wire format, however many sockets receive it
+    frame = Frame(event["payload"])
+    for conn in manager.recipients(targets) - skip:
+        if not conn.send(frame):
+            manager.disconnect(conn)
+
+
+def deliver_batch(channel_id: int, payloads: list):
+    """Sends a batched channel's pending events as one array frame per socket."""
+    frame = Frame({"type": "batch", "channel_id": channel_id, "events": payloads})
+    for conn in manager.recipients([("channel", channel_id)]):
+        if not conn.send(frame):
+            manager.disconnect(conn)
+
+
+# holds events for channels in batched delivery mode
+batcher = ChannelBatcher(deliver_batch)
+
+
+def deliver_channel_diff(_key, changes: list):
+    """Sends a burst of channel-list changes to every global listener as one diff."""
+    frame = Frame(coalesce(changes))
+    for conn in manager.recipients([("global", None)]):
+        if not conn.send(frame):
+            manager.disconnect(conn)
+
+
+# coalesces channel-list changes; the whole list is a single batched key
+CHANNEL_LIST = 0
+channel_list = ChannelBatcher(deliver_channel_diff, window_ms=CHANNEL_DIFF_WINDOW_MS, channels={CHANNEL_LIST})
+
+
+# carries realtime events to the sockets held by every worker process
+backplane = create_backplane(deliver_local)
+
+
+def publish(payload, *targets):
+    """Sends a payload to (kind, key) targets on every worker, each connection at most once."""
+    backplane.publish({"targets": [list(target) for target in targets], "payload": payload})
+
+
+def publish_control(control: str, **fields):
+    """Applies a subscription or history change on every worker."""
+    backplane.publish({"control": control, **fields})
+
+
+def remember_message(row: dict):
+    """Adds a stored message to this worker's hot tier now and to the other workers' via the backplane."""
+    hot_tier.append(row)
+    publish_control("history_append", row=jsonable_encoder(row))
+
+
+def forget_message(key: tuple, message_id: int):
+    """Removes a deleted message from every worker's hot tier."""
+    hot_tier.remove(key, message_id)
+    publish_control("history_remove", key=list(key), message_id=message_id)
 
 
 @app.websocket("/ws/channel/{channel_id}")
 async def websocket_endpoint(websocket: WebSocket, channel_id: int, db: Session = Depends(get_db)):
     await websocket.accept()
-    if channel_id not in channel_connections:
-        channel_connections[channel_id] = []
-    channel_connections[channel_id].append(websocket)
+    conn = Connection(websocket, kind="channel", key=channel_id, fmt=negotiate(websocket))
+    manager.connect_channel(conn, channel_id)
     print(f"✅ Client connected to channel {channel_id}")
 
     try:
         while True:
-            data = await websocket.receive_json()
-            sender_id = data.get("sender_id")
-            message_text = data.get("text")
+            try:
+                data = decode(channel_post_frame, await conn.receive(), conn.fmt)
+            except ValueError:
+                continue
+            sender_id = data.sender_id
+            message_text = data.text
 
             if not sender_id or not message_text:
                 continue
 
             print(f"Message in channel {channel_id}: {data}")
 
-            message = ChannelMessage(
+            message = await message_writer.submit(ChannelMessage(
                 channel_id=channel_id,
                 sender_id=sender_id,
                 text=message_text
-            )
-            db.add(message)
-            db.commit()
-            db.refresh(message)
+            ))
+            remember_message(message)
 
             response_data = {
-                "id": message.id,
+                "id": message["id"],
                 "channel_id": channel_id,
                 "sender_id": sender_id,
                 "text": message_text
             }
 
-            for ws in channel_connections[channel_id]:
-                await ws.send_json(response_data)
+            publish(response_data, ("channel", channel_id))
 
     except WebSocketDisconnect:
         print(f"Client disconnected from channel {channel_id}")
-        channel_connections[channel_id].remove(websocket)
+
+    finally:
+        manager.disconnect(conn)
+        await conn.close()
 
 
 @app.post("/test/channel-message/")
@@ -120,6 +261,7 @@ def test_channel_message(channel_id: int, sender_id: int, text: str, db: Session
         db.add(new_message)
         db.commit()
         db.refresh(new_message)
+        remember_message(as_row(new_message))
         return {"message": "Message saved!", "id": new_message.id}
     except Exception as e:
         db.rollback()
@@ -144,132 +286,224 @@ def login(user: UserCreate, db: Session = Depends(get_db)):
     return {"id": existing_user.id, "username": existing_user.username, "is_admin": existing_user.is_admin}
 
 
+async def relay_direct_message(conn: Connection, db: Session, sender_id: int, receiver_id: int, text: str):
+    """Stores a direct message sent over a socket and delivers it to both users' sockets."""
+    known_users = await run_db(count_users, db, {sender_id, receiver_id})
+    if known_users < len({sender_id, receiver_id}):
+        conn.send({"error": "Sender or receiver not found."})
+        return
+
+    new_message = await message_writer.submit(
+        DirectMessage(sender_id=sender_id, receiver_id=receiver_id, text=text)
+    )
+    remember_message(new_message)
+
+    response_data = {
+        "type": "direct",
+        "id": new_message["id"],
+        "sender_id": sender_id,
+        "receiver_id": receiver_id,
+        "content": text,
+    }
+
+    # Send to receiver and sender
+    publish(response_data, ("user", receiver_id), ("user", sender_id))
+
+
+async def relay_channel_message(sender_id: int, channel_id: int, text: str):
+    """Stores a channel message from a member and delivers it to the channel's sockets."""
+    new_message = await message_writer.submit(
+        ChannelMessage(channel_id=channel_id, sender_id=sender_id, text=text)
+    )
+    remember_message(new_message)
+
+    response_data = {
+        "type": "channel",
+        "id": new_message["id"],
+        "channel_id": channel_id,
+        "sender_id": sender_id,
+        "text": text
+    }
+
+    # Send to the channel's subscribers, plus the sender's other tabs
+    publish(response_data, ("channel", channel_id), ("user", sender_id))
+
+
+async def relay_channel_batch(sender_id: int, channel_id: int, texts: list):
+    """Stores several channel messages in one transaction and delivers each of them."""
+    new_messages = await message_writer.submit_many(
+        [ChannelMessage(channel_id=channel_id, sender_id=sender_id, text=text) for text in texts]
+    )
+    for new_message in new_messages:
+        remember_message(new_message)
+        publish({
+            "type": "channel",
+            "id": new_message["id"],
+            "channel_id": channel_id,
+            "sender_id": sender_id,
+            "text": new_message["text"]
+        }, ("channel", channel_id), ("user", sender_id))
+
+
 @app.websocket("/realtime/direct/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: int, db: Session = Depends(get_db)):
     """Handles real-time messaging: both direct and channel messages."""
     await websocket.accept()
+    conn = Connection(websocket, kind="direct", key=user_id, fmt=negotiate(websocket))
 
-    if user_id not in active_connections:
-        active_connections[user_id] = set()
-    active_connections[user_id].add(websocket)
+    manager.connect_user(conn, user_id, await run_db(member_channel_ids, db, user_id))
 
     try:
         while True:
-            data = await websocket.receive_text()
+            data = await conn.receive()
 
             try:
-                message = json.loads(data)
-                msg_type = message.get("type", "direct")  # default to direct if not specified
+                message = decode(realtime_frame, data, conn.fmt)
                 sender_id = user_id
 
-                if msg_type == "direct":
-                    receiver_id = message.get("receiver_id")
-                    message_text = message.get("content")
-
-                    new_message = store_direct_message(db, sender_id, receiver_id, message_text)
-
-                    response_data = {
-                        "type": "direct",
-                        "id": new_message["id"],
-                        "sender_id": sender_id,
-                        "receiver_id": receiver_id,
-                        "content": message_text,
-                    }
-
-                    # Send to receiver
-                    if receiver_id in active_connections:
-                        for ws in active_connections[receiver_id]:
-                            await ws.send_json(response_data)
-
-                    # Send to sender
-                    for ws in active_connections[sender_id]:
-                        await ws.send_json(response_data)
-
-                elif msg_type == "channel":
-                    channel_id = message.get("receiver_id") or message.get("channel_id")
-                    message_text = message.get("content") or message.get("text")
-
-                    new_message = ChannelMessage(channel_id=channel_id, sender_id=sender_id, text=message_text)
-                    db.add(new_message)
-                    db.commit()
-                    db.refresh(new_message)
-
-                    response_data = {
-                        "type": "channel",
-                        "id": new_message.id,
-                        "channel_id": channel_id,
-                        "sender_id": sender_id,
-                        "text": message_text
-                    }
-
-                    # Send to all connections in the channel (if we store them that way)
-                    # For now, just broadcast to all users (or optimize this later)
-                    for uid, conns in active_connections.items():
-                        for ws in conns:
-                            await ws.send_json(response_data)
-
-            except json.JSONDecodeError as e:
-                print(f"[ERROR] Invalid JSON received: {data}, Error: {e}")
+                if message.type == "direct":
+                    await relay_direct_message(conn, db, sender_id, message.receiver_id, message.content)
+
+                elif message.type == "channel":
+                    # only members may post; the index mirrors UserChannel for this socket
+                    if not manager.is_subscribed(conn, message.channel_id):
+                        conn.send({"error": "Not a member of this channel.", "channel_id": message.channel_id})
+                        continue
+
+                    await relay_channel_message(sender_id, message.channel_id, message.content)
+
+                elif message.type == "channel_batch":
+                    if not manager.is_subscribed(conn, message.channel_id):
+                        conn.send({"error": "Not a member of this channel.", "channel_id": message.channel_id})
+                        continue
+
+                    await relay_channel_batch(sender_id, message.channel_id, message.messages)
+
+            except ValueError as e:
+                print(f"[ERROR] Invalid message received: {data!r}, Error: {e}")
                 continue
 
     except WebSocketDisconnect:
         print(f"[INFO] WebSocket disconnected: {user_id}")
-        active_connections[user_id].remove(websocket)
-        if not active_connections[user_id]:
-            del active_connections[user_id]
 
     except Exception as e:
         print(f"[ERROR] WebSocket crashed: {e}")
 
+    finally:
+        manager.disconnect(conn)
+        await conn.close()
+
+@app.websocket("/realtime/mux/{user_id}")
+async def websocket_multiplexed(websocket: WebSocket, user_id: int, db: Session = Depends(get_db)):
+    """One socket per client for direct messages, channel messages and channel-list events.
+
+    Channel streams are opted into with {"type": "subscribe", "channel_id": ...}
+    and left with {"type": "unsubscribe", ...}; direct and channel frames are
+    the same as on /realtime/direct.
+    """
+    await websocket.accept()
+    conn = Connection(websocket, kind="mux", key=user_id, fmt=negotiate(websocket))
+    manager.connect_user(conn, user_id)
+    manager.connect_global(conn)
+
+    try:
+        await resync_channel_list(conn, db)
+        while True:
+            data = await conn.receive()
+            try:
+                message = decode(mux_frame, data, conn.fmt)
+            except ValueError as e:
+                print(f"[ERROR] Invalid message received: {data!r}, Error: {e}")
+                conn.send({"error": "Invalid message."})
+                continue
+
+            if message.type == "direct":
+                await relay_direct_message(conn, db, user_id, message.receiver_id, message.content)
+
+            elif message.type == "channel":
+                if not await run_db(is_member, db, user_id, message.channel_id):
+                    conn.send({"error": "Not a member of this channel.", "channel_id": message.channel_id})
+                    continue
+                await relay_channel_message(user_id, message.channel_id, message.content)
+
+            elif message.type == "channel_batch":
+                if not await run_db(is_member, db, user_id, message.channel_id):
+                    conn.send({"error": "Not a member of this channel.", "channel_id": message.channel_id})
+                    continue
+                await relay_channel_batch(user_id, message.channel_id, message.messages)
+
+            elif message.type == "subscribe":
+                if not await run_db(can_view_channel, db, user_id, message.channel_id):
+                    conn.send({"error": "Cannot subscribe to this channel.", "channel_id": message.channel_id})
+                    continue
+                manager.join(conn, message.channel_id)
+                conn.send({"type": "subscribed", "channel_id": message.channel_id})
+
+            elif message.type == "unsubscribe":
+                manager.leave(conn, message.channel_id)
+                conn.send({"type": "unsubscribed", "channel_id": message.channel_id})
+
+    except WebSocketDisconnect:
+        pass
+
+    finally:
+        manager.disconnect(conn)
+        await conn.close()
+
 # webSocket for Channels
 @app.websocket("/realtime/channel/{channel_id}/{user_id}")
 async def websocket_channel_endpoint(
         websocket: WebSocket, channel_id: int, user_id: int, db: Session = Depends(get_db)
 ):
     """Handles real-time channel messaging."""
-    user = db.query(User).filter_by(id=user_id).first()
+    user = await run_db(db.get, User, user_id)
     # if not user:
     #     await websocket.close(code=4001)
     #     return
 
-    channel = db.query(Channel).filter_by(id=channel_id).first()
+    channel = await run_db(db.get, Channel, channel_id)
     # if not channel:
     #     await websocket.close(code=4002)
     #     return
 
     await websocket.accept()
-    if channel_id not in active_connections:
-        active_connections[channel_id] = set()
-    active_connections[channel_id].add(websocket)
+    conn = Connection(websocket, kind="channel", key=channel_id, fmt=negotiate(websocket))
+    manager.connect_channel(conn, channel_id)
 
     try:
         while True:
-            data = await websocket.receive_json()
-            sender_id = data.get("sender_id")
-            message_text = data.get("text")
+            try:
+                data = decode(channel_post_frame, await conn.receive(), conn.fmt)
+            except ValueError:
+                conn.send({"error": "Invalid message."})
+                continue
+            sender_id = data.sender_id
+            message_text = data.text
 
             if sender_id != user_id:
-                await websocket.send_json({"error": "Unauthorized sender."})
+                conn.send({"error": "Unauthorized sender."})
                 continue
 
-            new_message = ChannelMessage(channel_id=channel_id, sender_id=sender_id, text=message_text)
-            db.add(new_message)
-            db.commit()
-            db.refresh(new_message)
+            new_message = await message_writer.submit(
+                ChannelMessage(channel_id=channel_id, sender_id=sender_id, text=message_text)
+            )
+            remember_message(new_message)
 
             response_data = {
+                "id": new_message["id"],
                 "channel_id": channel_id,
                 "sender_id": sender_id,
                 "text": message_text
             }
 
-            for conn in active_connections[channel_id]:
-                await conn.send_json(response_data)
+            publish(response_data, ("channel", channel_id))
 
     except WebSocketDisconnect:
-        active_connections[channel_id].remove(websocket)
-        if not active_connections[channel_id]:
-            del active_connections[channel_id]
+        pass
+
+    finally:
+        manager.disconnect(conn)
+        await conn.close()
 
 # retrieve Users
 @app.get("/users/")
@@ -320,6 +554,7 @@ def store_direct_message(db: Session, sender_id: int, receiver_id: int, text: st
     db.add(new_message)
     db.commit()
     db.refresh(new_message)
+    remember_message(as_row(new_message))
 
     return {
         "id": new_message.id,
@@ -341,6 +576,7 @@ def store_channel_message(db: Session, sender_id: int, channel_id: int, text: st
     db.add(new_message)
     db.commit()
     db.refresh(new_message)
+    remember_message(as_row(new_message))
 
     return {
         "id": new_message.id,
@@ -352,29 +588,41 @@ def store_channel_message(db: Session, sender_id: int, channel_id: int, text: st
 
 
 # get Messages Between Users
+def usernames(db: Session, user_ids: list) -> dict:
+    """Usernames by id, from the hot tier when possible."""
+    missing = [user_id for user_id in user_ids if user_id not in hot_tier.names]
+    if missing:
+        for user in db.query(User.id, User.username).filter(User.id.in_(missing)).all():
+            hot_tier.names[user.id] = user.username
+    return {user_id: hot_tier.names[user_id] for user_id in user_ids if user_id in hot_tier.names}
+
+
 @app.get("/messages/{user1_id}/{user2_id}")
-def get_messages(user1_id: int, user2_id: int, db: Session = Depends(get_db)):
-    messages = (
-        db.query(DirectMessage)
-        .filter(
+def get_messages(user1_id: int, user2_id: int, after: Optional[int] = None, db: Session = Depends(get_db)):
+    """Conversation history, or only the messages after a message id when replaying on reconnect."""
+    key = direct_key(user1_id, user2_id)
+    messages = hot_tier.recent(key, after)
+    if messages is None:
+        query = db.query(DirectMessage).filter(
             ((DirectMessage.sender_id == user1_id) & (DirectMessage.receiver_id == user2_id))
             | ((DirectMessage.sender_id == user2_id) & (DirectMessage.receiver_id == user1_id))
         )
-        .order_by(DirectMessage.timestamp.asc())
-        .all()
-    )
+        if after is not None:
+            query = query.filter(DirectMessage.id > after)
+        messages = [as_row(msg) for msg in query.order_by(DirectMessage.id.asc()).all()]
+        hot_tier.load(key, messages, floor=after or 0)
 
-    user_map = {user.id: user.username for user in db.query(User).filter(User.id.in_([user1_id, user2_id])).all()}
+    user_map = usernames(db, [user1_id, user2_id])
 
     return [
         {
-            "id": msg.id,
-            "sender_id": msg.sender_id,
-            "receiver_id": msg.receiver_id,
-            "sender_name": user_map.get(msg.sender_id, f"User {msg.sender_id}"),
-            "receiver_name": user_map.get(msg.receiver_id, f"User {msg.receiver_id}"),
-            "text": msg.text,
-            "timestamp": msg.timestamp
+            "id": msg["id"],
+            "sender_id": msg["sender_id"],
+            "receiver_id": msg["receiver_id"],
+            "sender_name": user_map.get(msg["sender_id"], f"User {msg['sender_id']}"),
+            "receiver_name": user_map.get(msg["receiver_id"], f"User {msg['receiver_id']}"),
+            "text": msg["text"],
+            "timestamp": msg["timestamp"]
         }
         for msg in messages
     ]
@@ -382,42 +630,68 @@ def get_messages(user1_id: int, user2_id: int, db: Session = Depends(get_db)):
 
 # get Channel Messages
 @app.get("/channel-messages/{channel_id}")
-def get_channel_messages(channel_id: int, db: Session = Depends(get_db)):
-    messages = (
-        db.query(ChannelMessage)
-        .filter(ChannelMessage.channel_id == channel_id)
-        .order_by(ChannelMessage.timestamp.asc())
-        .all()
-    )
-    return [{"id": msg.id, "sender_id": msg.sender_id, "text": msg.text} for msg in messages]
-
+def get_channel_messages(channel_id: int, after: Optional[int] = None, db: Session = Depends(get_db)):
+    """Channel history, or only the messages after a message id when replaying on reconnect."""
+    key = channel_key(channel_id)
+    messages = hot_tier.recent(key, after)
+    if messages is None:
+        query = db.query(ChannelMessage).filter(ChannelMessage.channel_id == channel_id)
+        if after is not None:
+            query = query.filter(ChannelMessage.id > after)
+        messages = [as_row(msg) for msg in query.order_by(ChannelMessage.id.asc()).all()]
+        hot_tier.load(key, messages, floor=after or 0)
 
-global_channel_connections: Set[WebSocket] = set()
+    return [{"id": msg["id"], "sender_id": msg["sender_id"], "text": msg["text"]} for msg in messages]
 
 
 @app.websocket("/realtime/global/channels")
 async def websocket_global_channels(websocket: WebSocket, db: Session = Depends(get_db)):
     await websocket.accept()
-    global_channel_connections.add(websocket)
+    conn = Connection(websocket, kind="global", fmt=negotiate(websocket))
+    manager.connect_global(conn)
 
     try:
+        await resync_channel_list(conn, db)
         while True:
-            data = await websocket.receive_text()
+            data = await conn.receive()
     except WebSocketDisconnect:
-        global_channel_connections.remove(websocket)
+        pass
     except Exception as e:
         print(f"WebSocket error: {e}")
-        global_channel_connections.remove(websocket)
+    finally:
+        manager.disconnect(conn)
+        await conn.close()
 
 
 # Function to broadcast global channel updates
-async def broadcast_channel_update(message: str):
-    for connection in global_channel_connections.copy():
-        try:
-            await connection.send_text(message)
-        except Exception as e:
-            print(f"Failed to send message to connection: {e}")
-            global_channel_connections.remove(connection)
+async def broadcast_channel_update(change: dict):
+    """Publishes a versioned channel-list change; each worker coalesces bursts into one diff."""
+    publish({"event": "channel_change", **change}, ("global", None))
+
+
+async def resync_channel_list(conn: Connection, db: Session):
+    """Sends a reconnecting client the channel-list diffs it missed, or a snapshot."""
+    since = conn.websocket.query_params.get("since")
+    if since is None:
+        return
+    try:
+        since = int(since)
+    except ValueError:
+        since = -1
+    conn.send(await run_db(changes_since, db, since))
+
+
+@app.get("/channels/changes")
+def get_channel_changes(since: int = -1, db: Session = Depends(get_db)):
+    """Channel-list changes after a version, or a snapshot when the client is too far behind."""
+    return changes_since(db, since)
+
+
+@app.get("/realtime/stats")
+def get_realtime_stats():
+    """Connection counts per user and channel, plus per-connection queue depths."""
+    return {**connection_stats(), **manager.stats(), "writer": message_writer.stats(), "hot_tier": hot_tier.stats(),
+            "batching": batcher.stats()}
 
 
 # create Channel
@@ -425,45 +699,46 @@ logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
+def insert_channel(db: Session, channel: ChannelCreate, user_id: int) -> tuple[Channel, dict]:
+    """Validates and stores a new channel with its channel-list change; runs on the DB executor."""
+    # checks if channel name is blank
+    channel_name = channel.name.strip()
+    if not channel_name:
+        raise HTTPException(status_code=400, detail="Channel name cannot be blank")
+
+    # check if another channel has the same name
+    existing_channel = db.query(Channel).filter(Channel.name.ilike(channel_name)).first()
+    if existing_channel:
+        raise HTTPException(status_code=400, detail="Channel name already exists")
+
+    # check if admin
+    current_user = db.query(User).filter(User.id == user_id).first()
+    if not current_user:
+        logger.error(f"User not found: {user_id}")
+        raise HTTPException(status_code=404, detail="User not found")
+
+    if not current_user.is_admin:
+        logger.error(f"User is not an admin: {user_id}")
+        raise HTTPException(status_code=403, detail="Only admins can create channels")
+
+    new_channel = Channel(name=channel.name, is_public=True)
+    db.add(new_channel)
+    db.flush()
+    change = as_change(record_change(db, "created", new_channel))
+    db.commit()
+    db.refresh(new_channel)
+    return new_channel, change
+
+
 @app.post("/channels/")
 async def create_channel(channel: ChannelCreate, db: Session = Depends(get_db), user_id: int = Header(None,alias="User-id")):
     logger.debug(f"Received request to create channel. User ID: {user_id}")
 
     try:
-        # checks if channel name is blank
-        channel_name = channel.name.strip()
-        if not channel_name:
-            raise HTTPException(status_code=400, detail="Channel name cannot be blank")
-
-        # check if another channel has the same name
-        existing_channel = db.query(Channel).filter(Channel.name.ilike(channel_name)).first()
-        if existing_channel:
-            raise HTTPException(status_code=400, detail="Channel name already exists")
-
-        # check if admin
-        current_user = db.query(User).filter(User.id == user_id).first()
-        if not current_user:
-            logger.error(f"User not found: {user_id}")
-            raise HTTPException(status_code=404, detail="User not found")
-
-        if not current_user.is_admin:
-            logger.error(f"User is not an admin: {user_id}")
-            raise HTTPException(status_code=403, detail="Only admins can create channels")
-
-        new_channel = Channel(name=channel.name, is_public=True)
-        db.add(new_channel)
-        db.commit()
-        db.refresh(new_channel)
+        new_channel, change = await run_db(insert_channel, db, channel, user_id)
         logger.debug(f"Channel created successfully: {new_channel}")
 
-        await broadcast_channel_update(json.dumps({
-            "event": "channel_created",
-            "channel": {
-                "id": new_channel.id,
-                "name": new_channel.name,
-                "is_public": new_channel.is_public,
-            },
-        }))
+        await broadcast_channel_update(change)
 
         return new_channel
 
@@ -475,8 +750,8 @@ async def create_channel(channel: ChannelCreate, db: Session = Depends(get_db),
 
 
 # delete channel
-@app.delete("/delete_channel/{channel_id}")
-async def delete_channel(channel_id: int, user_id: int = Header(..., alias="User-Id"), db: Session = Depends(get_db)):
+def remove_channel(db: Session, channel_id: int, user_id: int) -> dict:
+    """Checks admin rights and deletes a channel; returns its channel-list change."""
     current_user = db.query(User).filter(User.id == user_id).first()
 
     # check if user exists
@@ -492,18 +767,45 @@ async def delete_channel(channel_id: int, user_id: int = Header(..., alias="User
     if not channel_to_delete:
         raise HTTPException(status_code=404, detail="Channel not found")
 
+    change = as_change(record_change(db, "deleted", channel_to_delete))
     db.delete(channel_to_delete)
     db.commit()
+    return change
 
-    await broadcast_channel_update(json.dumps({
-        "event": "channel_deleted",
-        "channel_id": channel_id,
-    }))
+
+@app.delete("/delete_channel/{channel_id}")
+async def delete_channel(channel_id: int, user_id: int = Header(..., alias="User-Id"), db: Session = Depends(get_db)):
+    change = await run_db(remove_channel, db, channel_id, user_id)
+    hot_tier.drop(channel_key(channel_id))
+
+    publish_control("channel_deleted", channel_id=channel_id)
+
+    await broadcast_channel_update(change)
 
     return {"message": "Channel deleted successfully"}
 
 
 # join Channel
+def check_admin(db: Session, user_id: int):
+    current_user = db.get(User, user_id)
+    if not current_user:
+        raise HTTPException(status_code=404, detail="User not found")
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only admins can change channel settings")
+
+
+@app.post("/channels/{channel_id}/delivery")
+async def set_channel_delivery(channel_id: int, mode: str, user_id: int = Header(..., alias="User-Id"),
+                               db: Session = Depends(get_db)):
+    """Switches a channel between immediate frames and batched frames on every worker."""
+    if mode not in ("immediate", "batched"):
+        raise HTTPException(status_code=400, detail="Delivery mode must be 'immediate' or 'batched'")
+    await run_db(check_admin, db, user_id)
+
+    publish_control("delivery_mode", channel_id=channel_id, batched=mode == "batched")
+    return {"channel_id": channel_id, "mode": mode}
+
+
 @app.post("/join_channel/{channel_id}")
 def join_channel(channel_id: int, user_id: int, db=Depends(get_db)):
     user = db.query(User).filter(User.id == user_id).first()
@@ -518,6 +820,7 @@ def join_channel(channel_id: int, user_id: int, db=Depends(get_db)):
     new_membership = UserChannel(user_id=user.id, channel_id=channel_id)
     db.add(new_membership)
     db.commit()
+    publish_control("subscribe", user_id=user.id, channel_id=channel_id)
 
     return {"message": "Successfully joined the channel"}
 
@@ -544,12 +847,8 @@ def get_channels(user_id: int = Header(None,alias="User-id"), db: Session = Depe
     return available_channels
 
 
-@app.delete("/channel-messages/{message_id}")
-async def delete_channel_message(
-        message_id: int,
-        db: Session = Depends(get_db),
-        user_id: int = Header(None,alias="User-id")
-):
+def remove_channel_message(db: Session, message_id: int, user_id: int) -> int:
+    """Checks admin rights and deletes a channel message; returns its channel id."""
     # Check if admin
     current_user = db.query(User).filter(User.id == user_id).first()
     if not current_user:
@@ -563,43 +862,38 @@ async def delete_channel_message(
         raise HTTPException(status_code=404, detail="Message not found")
 
     channel_id = message.channel_id
-    message_id = message.id
-
-    # Notify all clients in the channel
-    await notify_message_deleted(message.channel_id, message_id)
-
     db.delete(message)
     db.commit()
+    return channel_id
+
+
+@app.delete("/channel-messages/{message_id}")
+async def delete_channel_message(
+        message_id: int,
+        db: Session = Depends(get_db),
+        user_id: int = Header(None,alias="User-id")
+):
+    channel_id = await run_db(remove_channel_message, db, message_id, user_id)
+    forget_message(channel_key(channel_id), message_id)
+
+    # Notify all clients in the channel
+    await notify_message_deleted(channel_id, message_id)
 
     return {"message": "Message deleted successfully"}
 
 
 async def notify_message_deleted(channel_id: int, message_id: int):
-    if channel_id in active_connections:
-        for websocket in active_connections[channel_id]:
-            try:
-                await websocket.send_json({
-                    "action": "message_deleted",
-                    "type": "channel",
-                    "channel_id": channel_id,
-                    "message_id": message_id,
-                })
-                print("Notified a client")
-            except Exception as e:
-                print(f"Failed to notify client: {e}")
-    else:
-        print("No active connections found for this channel")
+    publish({
+        "action": "message_deleted",
+        "type": "channel",
+        "channel_id": channel_id,
+        "message_id": message_id,
+    }, ("channel", channel_id))
 
 
 
-@app.delete("/direct-messages/{message_id}")
-async def delete_direct_message(
-        message_id: int,
-        db: Session = Depends(get_db),
-        user_id: Optional[str] = Header(None)
-):
-    user_id = int(user_id)
-
+def remove_direct_message(db: Session, message_id: int, user_id: int) -> tuple[int, int]:
+    """Checks admin rights and deletes a direct message; returns (sender_id, receiver_id)."""
     # Check if admin
     current_user = db.query(User).filter(User.id == user_id).first()
     if not current_user:
@@ -617,48 +911,60 @@ async def delete_direct_message(
 
     db.delete(message)
     db.commit()
+    return sender_id, receiver_id
+
+
+@app.delete("/direct-messages/{message_id}")
+async def delete_direct_message(
+        message_id: int,
+        db: Session = Depends(get_db),
+        user_id: Optional[str] = Header(None)
+):
+    user_id = int(user_id)
+    sender_id, receiver_id = await run_db(remove_direct_message, db, message_id, user_id)
+    forget_message(direct_key(sender_id, receiver_id), message_id)
 
     # Broadcast deletion to both sender and receiver
-    for uid in [sender_id, receiver_id]:
-        if uid in active_connections:
-            for ws in active_connections[uid]:
-                await ws.send_json({
-                    "action": "message_deleted",
-                    "type": "direct",
-                    "message_id": message_id,
-                    "sender_id": sender_id,
-                    "receiver_id": receiver_id,
-                })
+    publish({
+        "action": "message_deleted",
+        "type": "direct",
+        "message_id": message_id,
+        "sender_id": sender_id,
+        "receiver_id": receiver_id,
+    }, ("user", sender_id), ("user", receiver_id))
 
     return {"message": "Direct message deleted successfully"}
 
+def save_png(contents: bytes, file_path: str) -> tuple[int, int]:
+    """Re-encodes an uploaded image as PNG and returns its dimensions."""
+    with Image.open(BytesIO(contents)) as img:
+        img.save(file_path, format="PNG")
+        return img.size
+
+
+def insert_image(file_id: str, uploader_id: int, width: int, height: int):
+    """Stores image metadata; runs on the DB executor."""
+    db = SessionLocal()
+    try:
+        db.add(ImageModel(
+            filename=file_id,
+            uploader_id=uploader_id,
+            width=width,
+            height=height,
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
 @app.post("/upload")
 async def upload_image(file: UploadFile = File(...), uploader_id: int = Form(...)):
     file_id = f"{generate_media_id()}.png"
     file_path = os.path.join(image_dir, file_id)
 
     contents = await file.read()
-    with open("temp_upload", "wb") as temp_file:
-        temp_file.write(contents)
-
-    with Image.open(BytesIO(contents)) as img:
-        width, height = img.size
-
-    with Image.open("temp_upload") as img:
-        img.save(file_path, format="PNG")
-
-    db = SessionLocal()
-    db_image = ImageModel(
-        filename=file_id,
-        uploader_id=uploader_id,
-        width=width,
-        height=height,
-    )
-    db.add(db_image)
-    db.commit()
-    db.refresh(db_image)
-
-    os.remove("temp_upload")
+    width, height = await asyncio.to_thread(save_png, contents, file_path)
+    await run_db(insert_image, file_id, uploader_id, width, height)
 
     return {"filename": file_id}
 
@@ -854,6 +1160,7 @@ def subscribe_to_channel(user_id: int, channel_id: int, db: Session = Depends(ge
         new_sub = UserChannel(user_id=user_id, channel_id=channel_id)
         db.add(new_sub)
         db.commit()
+    publish_control("subscribe", user_id=user_id, channel_id=channel_id)
     return {"subscribed": True}
 
 @app.delete("/unsubscribe/{user_id}/{channel_id}")
@@ -863,6 +1170,7 @@ def unsubscribe_from_channel(user_id: int, channel_id: int, db: Session = Depend
     if sub:
         db.delete(sub)
         db.commit()
+    publish_control("unsubscribe", user_id=user_id, channel_id=channel_id)
     return {"subscribed": False}
 
 @app.get("/is-subscribed/{user_id}/{channel_id}")
@@ -0,0 +1,179 @@
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+
+# "inprocess" for a single worker, "unix" when running uvicorn with --workers N
+BACKPLANE = os.getenv("REALTIME_BACKPLANE", "inprocess")
+
+# directory where each worker binds its datagram socket
+BACKPLANE_DIR = os.getenv("REALTIME_BACKPLANE_DIR", os.path.join(tempfile.gettempdir(), "soen341-backplane"))
+
+# largest event a worker will accept from a peer
+MAX_EVENT_BYTES = 256 * 1024
+
+# how long the list of peer workers is cached before rescanning the directory
+PEER_REFRESH_SECONDS = 1.0
+
+
+class Backplane:
+    """Carries realtime events to every worker process, including this one.
+
+    publish() hands the event to the handler of every worker; the handler
+    then delivers it to the sockets that worker holds. Events must be
+    JSON-serializable.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.loop = None
+
+    def start(self, loop=None):
+        """Starts the transport. With a loop, local delivery is run on that loop."""
+        self.loop = loop
+
+    def stop(self):
+        pass
+
+    def publish(self, event: dict):
+        raise NotImplementedError
+
+    def _deliver(self, event: dict):
+        if self.loop is None or self._on_loop():
+            self.handler(event)
+        else:
+            self.loop.call_soon_threadsafe(self.handler, event)
+
+    def _on_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+
+class InProcessBackplane(Backplane):
+    """Single-worker backplane: events go straight to the local handler."""
+
+    def publish(self, event: dict):
+        self._deliver(event)
+
+
+class UnixSocketBackplane(Backplane):
+    """Multi-worker backplane over Unix datagram sockets on one host.
+
+    Every worker binds <directory>/<name>.sock and publishes by sending one
+    datagram to each peer socket it finds there. Sockets left behind by
+    dead workers are removed the first time a send to them is refused.
+    """
+
+    def __init__(self, handler, directory: str = BACKPLANE_DIR, name: str = None):
+        super().__init__(handler)
+        self.directory = directory
+        self.path = os.path.join(directory, f"{name or os.getpid()}.sock")
+        self.receiver = None
+        self.sender = None
+        self.thread = None
+        self.peers = []
+        self.peers_checked = 0.0
+
+    def start(self, loop=None):
+        super().start(loop)
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        self.receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.receiver.bind(self.path)
+        self.receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, MAX_EVENT_BYTES * 2)
+        self.sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sender.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, MAX_EVENT_BYTES * 2)
+        self.sender.setblocking(False)
+
+        self.thread = threading.Thread(target=self._listen, name="backplane", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.sender is not None:
+            # an empty datagram wakes the listener so it can exit
+            try:
+                self.sender.sendto(b"", self.path)
+            except OSError:
+                pass
+            self.sender.close()
+            self.sender = None
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+            self.thread = None
+        if self.receiver is not None:
+            self.receiver.close()
+            self.receiver = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def publish(self, event: dict):
+        self._deliver(event)
+        if self.sender is None:
+            return
+
+        data = json.dumps(event).encode()
+        if len(data) > MAX_EVENT_BYTES:
+            print(f"[ERROR] Backplane event of {len(data)} bytes exceeds {MAX_EVENT_BYTES}, "
+                  f"not delivered to other workers")
+            return
+
+        for peer in self._peers():
+            try:
+                self.sender.sendto(data, peer)
+            except (ConnectionRefusedError, FileNotFoundError):
+                self._forget(peer)
+            except BlockingIOError:
+                print(f"[WARN] Backplane peer {peer} is backlogged, event dropped")
+            except OSError as e:
+                print(f"[ERROR] Backplane send to {peer} failed: {e}")
+
+    def _peers(self):
+        now = time.monotonic()
+        if now - self.peers_checked > PEER_REFRESH_SECONDS:
+            self.peers = [
+                os.path.join(self.directory, name)
+                for name in os.listdir(self.directory)
+                if name.endswith(".sock") and os.path.join(self.directory, name) != self.path
+            ]
+            self.peers_checked = now
+        return self.peers
+
+    def _forget(self, peer: str):
+        try:
+            os.unlink(peer)
+        except OSError:
+            pass
+        if peer in self.peers:
+            self.peers.remove(peer)
+
+    def _listen(self):
+        receiver = self.receiver
+        while True:
+            try:
+                data = receiver.recv(MAX_EVENT_BYTES)
+            except OSError:
+                return
+            if not data:
+                return  # wake-up sent by stop()
+            try:
+                event = json.loads(data)
+            except json.JSONDecodeError as e:
+                print(f"[ERROR] Invalid backplane event: {e}")
+                continue
+            self._deliver(event)
+
+
+def create_backplane(handler, kind: str = BACKPLANE) -> Backplane:
+    """Builds the backplane selected by REALTIME_BACKPLANE around a local delivery handler."""
+    if kind == "inprocess":
+        return InProcessBackplane(handler)
+    if kind == "unix":
+        return UnixSocketBackplane(handler)
+    raise ValueError(f"Unknown realtime backplane: {kind}")
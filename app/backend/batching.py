@@ -0,0 +1,89 @@
+import asyncio
+import os
+import threading
+
+# how long events for a batched channel are held before they are sent together
+BATCH_WINDOW_MS = float(os.getenv("WS_BATCH_WINDOW_MS", "5"))
+
+# most events in one batch frame, and most messages a client may send in one frame
+BATCH_MAX_EVENTS = int(os.getenv("WS_BATCH_MAX_EVENTS", "64"))
+
+# channels that start in batched delivery mode, e.g. "3,7"
+BATCHED_CHANNELS = {int(cid) for cid in os.getenv("WS_BATCHED_CHANNELS", "").split(",") if cid.strip()}
+
+
+class ChannelBatcher:
+    """Coalesces events for channels in batched delivery mode.
+
+    Events added within the flush window (or until max_events) are handed
+    to deliver(channel_id, payloads) in one call, which sends them to each
+    recipient as a single array frame. Channels not in batched mode are
+    never touched.
+    """
+
+    def __init__(self, deliver, window_ms: float = BATCH_WINDOW_MS, max_events: int = BATCH_MAX_EVENTS,
+                 channels=BATCHED_CHANNELS):
+        self.deliver = deliver
+        self.window = window_ms / 1000
+        self.max_events = max_events
+        self.channels = set(channels)
+        self.pending = {}
+        # channel id -> loop its flush is scheduled on
+        self.timers = {}
+        self.lock = threading.Lock()
+
+        # counters exposed through stats()
+        self.batches = 0
+        self.events = 0
+
+    def is_batched(self, channel_id: int) -> bool:
+        return channel_id in self.channels
+
+    def set_mode(self, channel_id: int, batched: bool):
+        """Switches a channel between batched and immediate delivery."""
+        if batched:
+            self.channels.add(channel_id)
+        else:
+            self.channels.discard(channel_id)
+            self.flush(channel_id)
+
+    def add(self, channel_id: int, payload):
+        """Queues an event; the first one of a batch schedules its flush."""
+        with self.lock:
+            payloads = self.pending.setdefault(channel_id, [])
+            payloads.append(payload)
+            full = len(payloads) >= self.max_events
+            timer_loop = self.timers.get(channel_id)
+            # a flush scheduled on a loop that has since closed will never run
+            orphaned = timer_loop is not None and timer_loop.is_closed()
+
+        if full or orphaned:
+            self.flush(channel_id)
+        elif timer_loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                # no loop to wait on (a sync endpoint), so send right away
+                self.flush(channel_id)
+                return
+            with self.lock:
+                self.timers[channel_id] = loop
+            loop.call_later(self.window, self.flush, channel_id)
+
+    def flush(self, channel_id: int):
+        with self.lock:
+            payloads = self.pending.pop(channel_id, None)
+            self.timers.pop(channel_id, None)
+        if not payloads:
+            return
+        self.batches += 1
+        self.events += len(payloads)
+        self.deliver(channel_id, payloads)
+
+    def stats(self) -> dict:
+        return {
+            "batched_channels": sorted(self.channels),
+            "batches": self.batches,
+            "events": self.events,
+            "average_batch": round(self.events / self.batches, 2) if self.batches else 0,
+        }
@@ -0,0 +1,199 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+# most recent messages kept per channel or conversation
+HOT_TIER_MESSAGES = int(os.getenv("HOT_TIER_MESSAGES", "200"))
+
+# rough memory cap for all buffers together; least recently used keys go first
+HOT_TIER_MAX_BYTES = int(os.getenv("HOT_TIER_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# estimated per-row overhead on top of the message text
+ROW_OVERHEAD_BYTES = 200
+
+
+def channel_key(channel_id: int) -> tuple:
+    return ("channel", channel_id)
+
+
+def direct_key(user1_id: int, user2_id: int) -> tuple:
+    return ("direct", min(user1_id, user2_id), max(user1_id, user2_id))
+
+
+def message_key(row: dict) -> tuple:
+    """The buffer a stored ChannelMessage/DirectMessage row belongs to."""
+    if row.get("channel_id") is not None:
+        return channel_key(row["channel_id"])
+    return direct_key(row["sender_id"], row["receiver_id"])
+
+
+def as_row(message) -> dict:
+    """Column values of a ChannelMessage/DirectMessage instance."""
+    return {column.name: getattr(message, column.name) for column in message.__table__.columns}
+
+
+def cached_row(row: dict) -> dict:
+    """Normalizes a row to what SQLite hands back, so cached and queried history look the same."""
+    timestamp = row.get("timestamp")
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    if isinstance(timestamp, datetime) and timestamp.tzinfo is not None:
+        timestamp = timestamp.replace(tzinfo=None)
+    return {**row, "timestamp": timestamp}
+
+
+class Buffer:
+    """Recent rows of one channel or conversation, in id order.
+
+    Holds every message of its key with an id above floor; a floor of 0
+    means the buffer is the complete history.
+    """
+
+    __slots__ = ("rows", "floor", "size")
+
+    def __init__(self, floor: int):
+        self.rows = []
+        self.floor = floor
+        self.size = 0
+
+    def add(self, row: dict) -> int:
+        """Inserts a row unless it is already present. Returns the bytes added."""
+        if row["id"] <= self.floor:
+            return 0
+        position = len(self.rows)
+        while position and self.rows[position - 1]["id"] >= row["id"]:
+            if self.rows[position - 1]["id"] == row["id"]:
+                return 0
+            position -= 1
+        self.rows.insert(position, row)
+        added = _row_size(row)
+        self.size += added
+        return added
+
+    def trim(self, limit: int, floor: int = 0) -> int:
+        """Drops the oldest rows beyond limit or at or below floor. Returns the bytes freed."""
+        self.floor = max(self.floor, floor)
+        freed = 0
+        while self.rows and (len(self.rows) > limit or self.rows[0]["id"] <= self.floor):
+            oldest = self.rows.pop(0)
+            self.floor = max(self.floor, oldest["id"])
+            freed += _row_size(oldest)
+        self.size -= freed
+        return freed
+
+
+class HotTier:
+    """Bounded in-memory history per channel and per DM pair.
+
+    Writes are appended as they are stored, reads are served from the
+    buffer when it can prove it has every row asked for, and a miss is
+    loaded from the database and merged in. Safe to use from the event
+    loop, executor threads and the message writer at once.
+    """
+
+    def __init__(self, per_key: int = HOT_TIER_MESSAGES, max_bytes: int = HOT_TIER_MAX_BYTES):
+        self.per_key = per_key
+        self.max_bytes = max_bytes
+        self.buffers = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        # usernames never change, so they are cached for the life of the process
+        self.names = {}
+
+        # counters exposed through stats()
+        self.hits = 0
+        self.misses = 0
+
+    def append(self, row: dict):
+        """Records a newly stored message."""
+        row = cached_row(row)
+        key = message_key(row)
+        with self.lock:
+            buffer = self.buffers.get(key)
+            if buffer is None:
+                # everything after this write lands here too, so the floor is just below it
+                buffer = self.buffers[key] = Buffer(floor=row["id"] - 1)
+            self._add(buffer, [row])
+            self.buffers.move_to_end(key)
+            self._evict()
+
+    def load(self, key: tuple, rows: list, floor: int = 0):
+        """Merges rows read from the database; floor is the id they are complete above."""
+        with self.lock:
+            buffer = self.buffers.get(key)
+            if buffer is None:
+                buffer = self.buffers[key] = Buffer(floor=floor)
+            buffer.floor = min(buffer.floor, floor)
+            kept = rows[-self.per_key:]
+            # rows older than the ones kept are not in the buffer, so it only covers ids above them
+            dropped_floor = rows[-self.per_key - 1]["id"] if len(rows) > self.per_key else 0
+            self._add(buffer, [cached_row(row) for row in kept], dropped_floor)
+            self.buffers.move_to_end(key)
+            self._evict()
+
+    def recent(self, key: tuple, after: int = None):
+        """Rows with an id above after (or the full history), or None if the buffer cannot tell."""
+        with self.lock:
+            buffer = self.buffers.get(key)
+            if buffer is None or buffer.floor > (after or 0):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.buffers.move_to_end(key)
+            if after is None:
+                return list(buffer.rows)
+            return [row for row in buffer.rows if row["id"] > after]
+
+    def remove(self, key: tuple, message_id: int):
+        """Applies a deleted message."""
+        with self.lock:
+            buffer = self.buffers.get(key)
+            if buffer is None:
+                return
+            for index, row in enumerate(buffer.rows):
+                if row["id"] == message_id:
+                    del buffer.rows[index]
+                    freed = _row_size(row)
+                    buffer.size -= freed
+                    self.size -= freed
+                    return
+
+    def drop(self, key: tuple):
+        """Forgets a key entirely, e.g. a deleted channel."""
+        with self.lock:
+            buffer = self.buffers.pop(key, None)
+            if buffer is not None:
+                self.size -= buffer.size
+
+    def clear(self):
+        with self.lock:
+            self.buffers.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self.buffers),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _add(self, buffer: Buffer, rows: list, floor: int = 0):
+        for row in rows:
+            self.size += buffer.add(row)
+        self.size -= buffer.trim(self.per_key, floor)
+
+    def _evict(self):
+        while self.size > self.max_bytes and len(self.buffers) > 1:
+            _key, buffer = self.buffers.popitem(last=False)
+            self.size -= buffer.size
+
+
+def _row_size(row: dict) -> int:
+    return len(row.get("text") or "") + ROW_OVERHEAD_BYTES
+
+
+# shared hot tier used by the history endpoints
+hot_tier = HotTier()
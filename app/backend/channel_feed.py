@@ -0,0 +1,90 @@
+import os
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.backend.models import Channel, ChannelEvent
+
+# how long channel-list changes are collected before one diff is sent
+CHANNEL_DIFF_WINDOW_MS = float(os.getenv("CHANNEL_DIFF_WINDOW_MS", "50"))
+
+# most changes replayed to a reconnecting client before it gets a snapshot instead
+CHANNEL_REPLAY_LIMIT = int(os.getenv("CHANNEL_REPLAY_LIMIT", "500"))
+
+# channel events kept in the log; older ones are pruned as new ones are written
+CHANNEL_EVENT_RETENTION = int(os.getenv("CHANNEL_EVENT_RETENTION", "1000"))
+
+
+def record_change(db: Session, action: str, channel: Channel) -> ChannelEvent:
+    """Adds a channel-list change to the caller's transaction; the version is set on flush."""
+    event = ChannelEvent(action=action, channel_id=channel.id, name=channel.name, is_public=channel.is_public)
+    db.add(event)
+    db.flush()
+
+    if event.version % 100 == 0:
+        db.query(ChannelEvent).filter(ChannelEvent.version <= event.version - CHANNEL_EVENT_RETENTION).delete()
+    return event
+
+
+def as_change(event: ChannelEvent) -> dict:
+    """The JSON form of a logged change, as published on the global stream."""
+    change = {"version": event.version, "action": event.action, "channel_id": event.channel_id}
+    if event.action == "created":
+        change["channel"] = {"id": event.channel_id, "name": event.name, "is_public": event.is_public}
+    return change
+
+
+def coalesce(changes: list) -> dict:
+    """Folds changes into one diff; clients apply removed before added."""
+    changes = sorted(changes, key=lambda change: change["version"])
+    added, removed = {}, []
+    for change in changes:
+        if change["action"] == "created":
+            added[change["channel_id"]] = change["channel"]
+        else:
+            added.pop(change["channel_id"], None)
+            if change["channel_id"] not in removed:
+                removed.append(change["channel_id"])
+
+    return {
+        "event": "channels_diff",
+        "from_version": changes[0]["version"] - 1,
+        "version": changes[-1]["version"],
+        "added": list(added.values()),
+        "removed": removed,
+    }
+
+
+def current_version(db: Session) -> int:
+    return db.query(func.max(ChannelEvent.version)).scalar() or 0
+
+
+def snapshot(db: Session) -> dict:
+    version = current_version(db)
+    channels = db.query(Channel).order_by(Channel.id).all()
+    return {
+        "event": "channels_snapshot",
+        "version": version,
+        "channels": [{"id": channel.id, "name": channel.name, "is_public": channel.is_public} for channel in channels],
+    }
+
+
+def changes_since(db: Session, since: int) -> dict:
+    """What a client at version since is missing: a diff, nothing new, or a full snapshot."""
+    oldest = db.query(func.min(ChannelEvent.version)).scalar()
+    events = (
+        db.query(ChannelEvent)
+        .filter(ChannelEvent.version > since)
+        .order_by(ChannelEvent.version)
+        .limit(CHANNEL_REPLAY_LIMIT + 1)
+        .all()
+    )
+
+    pruned = oldest is not None and since < oldest - 1
+    if since < 0 or pruned or len(events) > CHANNEL_REPLAY_LIMIT:
+        return snapshot(db)
+    if not events:
+        if since > current_version(db):
+            return snapshot(db)  # the client saw versions this log never had
+        return {"event": "channels_diff", "from_version": since, "version": since, "added": [], "removed": []}
+    return coalesce([as_change(event) for event in events])
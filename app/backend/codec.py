@@ -0,0 +1,162 @@
+import json
+from typing import Annotated, Literal, Optional, Union
+
+from fastapi import WebSocket, WebSocketDisconnect
+from pydantic import BaseModel, Discriminator, Field, Tag, TypeAdapter, ValidationError, model_validator
+
+from app.backend.batching import BATCH_MAX_EVENTS
+
+try:
+    import msgpack
+except ImportError:  # optional: clients fall back to JSON
+    msgpack = None
+
+# wire formats a client can ask for with ?format=... when connecting
+JSON = "json"
+MSGPACK = "msgpack"
+
+
+def negotiate(websocket: WebSocket) -> str:
+    """Picks the wire format requested by the client, falling back to JSON."""
+    requested = websocket.query_params.get("format", JSON).lower()
+    if requested == MSGPACK and msgpack is not None:
+        return MSGPACK
+    return JSON
+
+
+# heartbeat frames; any frame from a client counts as liveness, but clients should answer PING with PONG
+PING = {"type": "ping"}
+PONG = {"type": "pong"}
+
+
+def encode(payload, fmt: str = JSON):
+    """Encodes a payload as a text (JSON) or binary (MessagePack) frame."""
+    if isinstance(payload, (str, bytes)):
+        return payload  # already encoded by the caller
+    if fmt == MSGPACK:
+        return msgpack.packb(payload, use_bin_type=True)
+    return json.dumps(payload, separators=(",", ":"))
+
+
+class Frame:
+    """An outbound event shared by every recipient, encoded at most once per format."""
+
+    __slots__ = ("payload", "encoded")
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.encoded = {}
+
+    def encode(self, fmt: str = JSON):
+        data = self.encoded.get(fmt)
+        if data is None:
+            # recipients on other threads may race here; both produce the same bytes
+            data = self.encoded[fmt] = encode(self.payload, fmt)
+        return data
+
+
+class DirectFrame(BaseModel):
+    """A direct message sent over a user's personal socket."""
+    type: Literal["direct"] = "direct"
+    receiver_id: int
+    content: str
+
+
+class ChannelFrame(BaseModel):
+    """A channel message sent over a user's personal socket."""
+    type: Literal["channel"]
+    channel_id: Optional[int] = None
+    receiver_id: Optional[int] = None
+    content: Optional[str] = None
+    text: Optional[str] = None
+
+    @model_validator(mode="after")
+    def fill_aliases(self):
+        # older clients send the channel as receiver_id and the body as text
+        self.channel_id = self.channel_id if self.channel_id is not None else self.receiver_id
+        self.content = self.content if self.content is not None else self.text
+        if self.channel_id is None or self.content is None:
+            raise ValueError("channel messages need a channel_id and content")
+        return self
+
+
+class ChannelBatchFrame(BaseModel):
+    """Several channel messages persisted together."""
+    type: Literal["channel_batch"]
+    channel_id: int
+    messages: list[str] = Field(min_length=1, max_length=BATCH_MAX_EVENTS)
+
+
+class SubscriptionFrame(BaseModel):
+    """Starts or stops a channel stream on a multiplexed socket."""
+    type: Literal["subscribe", "unsubscribe"]
+    channel_id: int
+
+
+class ChannelPostFrame(BaseModel):
+    """A message sent over a single-channel socket."""
+    sender_id: int
+    text: str
+
+
+def _frame_type(value) -> str:
+    if isinstance(value, dict):
+        return value.get("type", "direct")
+    return getattr(value, "type", "direct")
+
+
+# validators are built once at import, not per frame
+realtime_frame = TypeAdapter(Annotated[
+    Union[
+        Annotated[DirectFrame, Tag("direct")],
+        Annotated[ChannelFrame, Tag("channel")],
+        Annotated[ChannelBatchFrame, Tag("channel_batch")],
+    ],
+    Discriminator(_frame_type),
+])
+mux_frame = TypeAdapter(Annotated[
+    Union[
+        Annotated[DirectFrame, Tag("direct")],
+        Annotated[ChannelFrame, Tag("channel")],
+        Annotated[ChannelBatchFrame, Tag("channel_batch")],
+        Annotated[SubscriptionFrame, Tag("subscribe")],
+        Annotated[SubscriptionFrame, Tag("unsubscribe")],
+    ],
+    Discriminator(_frame_type),
+])
+channel_post_frame = TypeAdapter(ChannelPostFrame)
+
+
+def decode(adapter: TypeAdapter, data, fmt: str = JSON):
+    """Validates an inbound frame. Raises ValueError if it is malformed."""
+    if isinstance(data, bytes) and fmt == MSGPACK:
+        try:
+            return adapter.validate_python(msgpack.unpackb(data, raw=False))
+        except (ValidationError, ValueError, msgpack.ExtraData) as e:
+            raise ValueError(str(e)) from e
+    try:
+        return adapter.validate_json(data)
+    except ValidationError as e:
+        raise ValueError(str(e)) from e
+
+
+def is_pong(data, fmt: str = JSON) -> bool:
+    """True for a heartbeat reply, which handlers never see."""
+    if data is None or len(data) > 32:
+        return False
+    try:
+        if isinstance(data, bytes) and fmt == MSGPACK:
+            return msgpack.unpackb(data, raw=False) == PONG
+        return json.loads(data) == PONG
+    except ValueError:
+        return False
+
+
+async def receive(websocket: WebSocket):
+    """Returns the next text or binary frame from a client."""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    if message.get("bytes") is not None:
+        return message["bytes"]
+    return message.get("text")
@@ -0,0 +1,323 @@
+import asyncio
+import os
+import time
+
+from fastapi import WebSocket
+
+from app.backend import codec
+from app.backend.codec import JSON, PING, Frame, encode
+
+# outbound frames buffered per socket before the overflow policy kicks in
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+
+# "drop" discards frames for a full queue, "disconnect" evicts the slow consumer
+OVERFLOW_POLICY = os.getenv("WS_OVERFLOW_POLICY", "drop")
+
+# close code sent to consumers evicted by the "disconnect" policy
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+# seconds between heartbeat sweeps; quiet sockets are pinged on each sweep
+HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "20"))
+
+# sockets that sent nothing, not even a pong, for this long are reaped
+IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "60"))
+
+# close code sent to reaped sockets
+IDLE_CLOSE_CODE = 1001
+
+# every open connection, for stats
+live_connections = set()
+
+
+class Connection:
+    """A WebSocket with a bounded outbound queue drained by its own writer task.
+
+    Broadcasts call send(), which never waits on the network, so one stalled
+    client cannot hold up delivery to the others or block the sender's loop.
+    """
+
+    def __init__(self, websocket: WebSocket, kind: str, key=None, fmt: str = JSON,
+                 max_queue: int = SEND_QUEUE_SIZE, overflow_policy: str = OVERFLOW_POLICY):
+        if overflow_policy not in ("drop", "disconnect"):
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+
+        self.websocket = websocket
+        self.kind = kind
+        self.key = key
+        self.fmt = fmt
+        self.overflow_policy = overflow_policy
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.closed = False
+        self.last_seen = time.monotonic()
+
+        # counters exposed through stats()
+        self.sent = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+        # sockets can be fed from other threads and loops (executors, test clients)
+        self.loop = asyncio.get_running_loop()
+        self.writer = self.loop.create_task(self._drain())
+        live_connections.add(self)
+
+    def send(self, payload) -> bool:
+        """Queues a Frame, dict, str or bytes without waiting. Returns False once closed."""
+        if self.closed:
+            return False
+
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is self.loop:
+            self._enqueue(payload)
+        else:
+            try:
+                self.loop.call_soon_threadsafe(self._enqueue, payload)
+            except RuntimeError:
+                # the owning loop is gone, so is the socket
+                self.closed = True
+                live_connections.discard(self)
+                return False
+        return True
+
+    async def receive(self):
+        """Next text or binary frame from the client. Heartbeat replies are consumed here."""
+        while True:
+            data = await codec.receive(self.websocket)
+            self.last_seen = time.monotonic()
+            if not codec.is_pong(data, self.fmt):
+                return data
+
+    def _enqueue(self, payload):
+        if self.closed:
+            return
+
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.overflow_policy == "disconnect":
+                print(f"[WARN] Evicting slow consumer {self.kind}:{self.key}")
+                self.evict()
+            return
+
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    async def _drain(self):
+        try:
+            while True:
+                payload = await self.queue.get()
+                if isinstance(payload, Frame):
+                    payload = payload.encode(self.fmt)
+                else:
+                    payload = encode(payload, self.fmt)
+
+                if isinstance(payload, bytes):
+                    await self.websocket.send_bytes(payload)
+                else:
+                    await self.websocket.send_text(payload)
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[ERROR] Send failed for {self.kind}:{self.key}: {e}")
+            self.closed = True
+            live_connections.discard(self)
+
+    def evict(self, code: int = SLOW_CONSUMER_CLOSE_CODE):
+        """Stops delivery and closes the socket; the handler's receive loop then exits."""
+        self.closed = True
+        live_connections.discard(self)
+        self.writer.cancel()
+        self.loop.create_task(self._close_socket(code))
+
+    def reap(self):
+        """Closes an idle socket from any thread."""
+        if self.closed:
+            return
+        self.closed = True
+        live_connections.discard(self)
+        try:
+            self.loop.call_soon_threadsafe(self.evict, IDLE_CLOSE_CODE)
+        except RuntimeError:
+            pass  # the owning loop is gone already
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def close(self):
+        """Stops the writer task. Called by the endpoint once the socket is gone."""
+        self.closed = True
+        live_connections.discard(self)
+        self.writer.cancel()
+        try:
+            await self.writer
+        except (asyncio.CancelledError, Exception):
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "key": self.key,
+            "format": self.fmt,
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "max_queue_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+        }
+
+
+def connection_stats() -> dict:
+    """Queue-depth stats for every open connection."""
+    connections = [conn.stats() for conn in list(live_connections)]
+    return {
+        "connections": len(connections),
+        "overflow_policy": OVERFLOW_POLICY,
+        "queued": sum(conn["queue_depth"] for conn in connections),
+        "dropped": sum(conn["dropped"] for conn in connections),
+        "per_connection": connections,
+    }
+
+
+class ConnectionManager:
+    """Registry of this worker's realtime connections.
+
+    User ids and channel ids live in separate indexes, so user 5 and
+    channel 5 never share sockets. Every lookup and update is O(1) per
+    connection touched, and disconnect() removes a connection from every
+    index it is in.
+    """
+
+    def __init__(self):
+        # user id -> that user's personal (direct) connections
+        self.users = {}
+        # channel id -> connections that receive the channel's events
+        self.channels = {}
+        # websocket -> its Connection
+        self.sockets = {}
+        # connection -> channel ids it is registered under, for cleanup
+        self.subscriptions = {}
+        # connections listening for channel-list changes
+        self.global_listeners = set()
+        # connections removed by sweep(), for stats
+        self.reaped = 0
+
+    def connect_user(self, conn: Connection, user_id: int, channel_ids=()):
+        """Registers a user's personal (direct or mux) connection and the channels it follows."""
+        self.sockets[conn.websocket] = conn
+        self.users.setdefault(user_id, set()).add(conn)
+        self.subscriptions[conn] = set()
+        for channel_id in channel_ids:
+            self._join(conn, channel_id)
+
+    def connect_channel(self, conn: Connection, channel_id: int):
+        """Registers a connection opened for a single channel."""
+        self.sockets[conn.websocket] = conn
+        self.subscriptions[conn] = set()
+        self._join(conn, channel_id)
+
+    def connect_global(self, conn: Connection):
+        """Registers a connection that listens for channel-list changes."""
+        self.sockets[conn.websocket] = conn
+        self.global_listeners.add(conn)
+
+    def disconnect(self, conn: Connection):
+        """Removes a connection from every index. Safe to call more than once."""
+        self.sockets.pop(conn.websocket, None)
+        self.global_listeners.discard(conn)
+
+        for channel_id in self.subscriptions.pop(conn, ()):
+            self._discard(self.channels, channel_id, conn)
+
+        if conn.kind in ("direct", "mux"):
+            self._discard(self.users, conn.key, conn)
+
+    def subscribe(self, user_id: int, channel_id: int):
+        """Adds a user's open personal connections to a channel they joined."""
+        for conn in self.users.get(user_id, ()):
+            self._join(conn, channel_id)
+
+    def unsubscribe(self, user_id: int, channel_id: int):
+        """Removes a user's open personal connections from a channel they left."""
+        for conn in self.users.get(user_id, ()):
+            self.subscriptions.get(conn, set()).discard(channel_id)
+            self._discard(self.channels, channel_id, conn)
+
+    def join(self, conn: Connection, channel_id: int):
+        """Adds one connection to a channel's stream."""
+        if conn in self.subscriptions:
+            self._join(conn, channel_id)
+
+    def leave(self, conn: Connection, channel_id: int):
+        """Removes one connection from a channel's stream."""
+        self.subscriptions.get(conn, set()).discard(channel_id)
+        self._discard(self.channels, channel_id, conn)
+
+    def drop_channel(self, channel_id: int):
+        """Forgets a deleted channel. Its single-channel sockets stay open until they disconnect."""
+        for conn in self.channels.pop(channel_id, ()):
+            self.subscriptions.get(conn, set()).discard(channel_id)
+
+    def sweep(self, now: float = None) -> int:
+        """Pings quiet sockets and reaps dead or idle ones. Returns how many were reaped."""
+        now = time.monotonic() if now is None else now
+        reaped = 0
+        for conn in list(self.sockets.values()):
+            idle = now - conn.last_seen
+            if conn.closed or idle > IDLE_TIMEOUT:
+                print(f"[INFO] Reaping {conn.kind}:{conn.key} after {idle:.0f}s without traffic")
+                conn.reap()
+                self.disconnect(conn)
+                reaped += 1
+            elif idle >= HEARTBEAT_INTERVAL:
+                conn.send(PING)
+        self.reaped += reaped
+        return reaped
+
+    def is_subscribed(self, conn: Connection, channel_id: int) -> bool:
+        return channel_id in self.subscriptions.get(conn, ())
+
+    def lookup(self, websocket) -> Connection:
+        return self.sockets.get(websocket)
+
+    def recipients(self, targets) -> set:
+        """Connections matching ("user", id), ("channel", id) or ("global", None) targets."""
+        found = set()
+        for kind, key in targets:
+            if kind == "user":
+                found.update(self.users.get(key, ()))
+            elif kind == "channel":
+                found.update(self.channels.get(key, ()))
+            elif kind == "global":
+                found.update(self.global_listeners)
+        return found
+
+    def stats(self) -> dict:
+        """Counts for capacity planning."""
+        return {
+            "connections": len(self.sockets),
+            "users": len(self.users),
+            "channels": len(self.channels),
+            "global_listeners": len(self.global_listeners),
+            "reaped": self.reaped,
+            "sockets_per_channel": {channel_id: len(conns) for channel_id, conns in self.channels.items()},
+        }
+
+    def _join(self, conn: Connection, channel_id: int):
+        self.subscriptions[conn].add(channel_id)
+        self.channels.setdefault(channel_id, set()).add(conn)
+
+    @staticmethod
+    def _discard(index: dict, key, conn: Connection):
+        conns = index.get(key)
+        if conns is None:
+            return
+        conns.discard(conn)
+        if not conns:
+            del index[key]
@@ -1,3 +1,7 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy import create_engine, inspect
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.backend.base import Base 
@@ -14,6 +18,18 @@ DATABASE_URL = "sqlite:///./app/backend/database.db"
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# threads for blocking database work started from async endpoints, sized separately
+# from the default threadpool so slow queries cannot starve other blocking work
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "4"))
+db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+
+
+async def run_db(fn, *args, **kwargs):
+    """Runs a blocking database call on the DB executor so the event loop keeps serving sockets."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(fn, *args, **kwargs))
+
+
 # start session 
 def get_db():
     """Provides a database session to API endpoints."""
@@ -98,4 +98,18 @@ class Video(Base):
     filename = Column(String, unique=True, index=True)
     uploader_id = Column(Integer)
     width = Column(Integer)
-    height = Column(Integer)
\ No newline at end of file
+    height = Column(Integer)
+
+class ChannelEvent(Base):
+    """Versioned log of channel-list changes, replayed to clients that reconnect."""
+    __tablename__ = "channel_events"
+    # AUTOINCREMENT so versions are never reused after old events are pruned
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    # version, what happened, and the channel as it was at that point
+    version = Column(Integer, primary_key=True)
+    action = Column(String, nullable=False)  # "created" or "deleted"
+    channel_id = Column(Integer, nullable=False)
+    name = Column(String)
+    is_public = Column(Boolean)
+    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc))
@@ -0,0 +1,186 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+
+from app.backend.database import SessionLocal
+
+# how long the writer waits for more messages after the first one of a batch
+FLUSH_WINDOW_MS = float(os.getenv("MESSAGE_FLUSH_WINDOW_MS", "5"))
+
+# most messages committed in one transaction
+MAX_BATCH_SIZE = int(os.getenv("MESSAGE_MAX_BATCH", "128"))
+
+
+class MessageWriter:
+    """Group-commits ChannelMessage/DirectMessage inserts from realtime handlers.
+
+    Handlers await submit(); a single writer thread collects everything that
+    arrives within the flush window (or up to the batch size) and commits it
+    in one transaction, so a burst costs one fsync and one lock acquisition
+    instead of one per message. Each submit() resolves only after its batch
+    is durable.
+    """
+
+    def __init__(self, session_factory=SessionLocal, flush_window_ms: float = FLUSH_WINDOW_MS,
+                 max_batch: int = MAX_BATCH_SIZE):
+        self.session_factory = session_factory
+        self.flush_window = flush_window_ms / 1000
+        self.max_batch = max_batch
+        self.pending = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+        # counters exposed through stats()
+        self.flushes = 0
+        self.messages = 0
+        self.largest_batch = 0
+        self.total_flush_seconds = 0.0
+        self.slowest_flush_seconds = 0.0
+
+    async def submit(self, message) -> dict:
+        """Queues a new message row and waits until it is committed. Returns its columns."""
+        return (await self.submit_many([message]))[0]
+
+    async def submit_many(self, messages: list) -> list:
+        """Queues several rows that must be committed in the same transaction."""
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.put((messages, loop, future))
+        return await future
+
+    def stop(self):
+        """Flushes whatever is queued and stops the writer thread."""
+        with self.lock:
+            if self.thread is None:
+                return
+            self.pending.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def stats(self) -> dict:
+        return {
+            "flushes": self.flushes,
+            "messages": self.messages,
+            "queued": self.pending.qsize(),
+            "largest_batch": self.largest_batch,
+            "average_batch": round(self.messages / self.flushes, 2) if self.flushes else 0,
+            "average_flush_ms": round(self.total_flush_seconds * 1000 / self.flushes, 3) if self.flushes else 0,
+            "slowest_flush_ms": round(self.slowest_flush_seconds * 1000, 3),
+        }
+
+    def _ensure_started(self):
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            first = self.pending.get()
+            if first is None:
+                return
+
+            batch = [first]
+            size = len(first[0])
+            deadline = time.monotonic() + self.flush_window
+            stopping = False
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            self._flush(batch)
+            if stopping:
+                return
+
+    def _flush(self, batch: list):
+        started = time.perf_counter()
+        try:
+            rows = self._commit([message for messages, _loop, _future in batch for message in messages])
+        except Exception as e:
+            # one bad submission must not fail the others, so retry them one by one
+            print(f"[ERROR] Group commit of {len(batch)} submissions failed, retrying individually: {e}")
+            for item in batch:
+                self._flush_single(item)
+            return
+
+        elapsed = time.perf_counter() - started
+        self._record(len(rows), elapsed)
+        offset = 0
+        for messages, loop, future in batch:
+            _resolve(loop, future, rows[offset:offset + len(messages)])
+            offset += len(messages)
+
+    def _flush_single(self, item):
+        messages, loop, future = item
+        started = time.perf_counter()
+        try:
+            rows = self._commit(messages)
+        except Exception as e:
+            _reject(loop, future, e)
+            return
+        self._record(len(rows), time.perf_counter() - started)
+        _resolve(loop, future, rows)
+
+    def _commit(self, messages: list) -> list:
+        db = self.session_factory()
+        # rows are read back from the objects, not reloaded from the database
+        db.expire_on_commit = False
+        try:
+            db.add_all(messages)
+            db.commit()
+            return [_columns(message) for message in messages]
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _record(self, count: int, elapsed: float):
+        self.flushes += 1
+        self.messages += count
+        self.largest_batch = max(self.largest_batch, count)
+        self.total_flush_seconds += elapsed
+        self.slowest_flush_seconds = max(self.slowest_flush_seconds, elapsed)
+
+
+def _columns(message) -> dict:
+    return {column.name: getattr(message, column.name) for column in message.__table__.columns}
+
+
+def _resolve(loop, future, rows):
+    def settle():
+        if not future.done():
+            future.set_result(rows)
+    try:
+        loop.call_soon_threadsafe(settle)
+    except RuntimeError:
+        pass  # the submitter's loop has shut down
+
+
+def _reject(loop, future, error):
+    def settle():
+        if not future.done():
+            future.set_exception(error)
+    try:
+        loop.call_soon_threadsafe(settle)
+    except RuntimeError:
+        pass
+
+
+# shared writer used by the realtime handlers
+message_writer = MessageWriter()
@@ -0,0 +1,94 @@
+"""Frames/sec and delivery latency for a busy channel, immediate vs batched.
+
+Run from the repository root:
+
+    python -m app.benchmarks.batch_delivery --members 200 --messages 2000
+
+Events go through api.deliver_local, the same path the backplane uses,
+to in-memory sockets that timestamp every frame they are handed. The
+latency of an event is the time from publish to the frame that carries
+it being written.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from app.backend import api
+from app.backend.connections import Connection
+
+CHANNEL_ID = -1  # no real channel uses a negative id
+
+
+class TimingWebSocket:
+    """Records when each event reaches the socket."""
+
+    def __init__(self, latencies: list):
+        self.latencies = latencies
+        self.frames = 0
+
+    async def send_text(self, data):
+        now = time.perf_counter()
+        self.frames += 1
+        message = json.loads(data)
+        for event in message["events"] if message.get("type") == "batch" else [message]:
+            self.latencies.append(now - event["sent_at"])
+
+    async def send_bytes(self, data):
+        raise NotImplementedError
+
+    async def close(self, code=1000):
+        pass
+
+
+async def run(members: int, messages: int, burst: int, batched: bool) -> dict:
+    api.batcher.set_mode(CHANNEL_ID, batched)
+    latencies = []
+    sockets = [TimingWebSocket(latencies) for _ in range(members)]
+    conns = [Connection(ws, kind="channel", key=CHANNEL_ID, max_queue=messages + 1) for ws in sockets]
+    for conn in conns:
+        api.manager.connect_channel(conn, CHANNEL_ID)
+
+    started = time.perf_counter()
+    for n in range(messages):
+        api.deliver_local({
+            "targets": [["channel", CHANNEL_ID]],
+            "payload": {"channel_id": CHANNEL_ID, "text": f"message {n}", "sent_at": time.perf_counter()},
+        })
+        if n % burst == burst - 1:
+            await asyncio.sleep(0)
+    while len(latencies) < members * messages:
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - started
+
+    for conn in conns:
+        api.manager.disconnect(conn)
+        await conn.close()
+    api.batcher.set_mode(CHANNEL_ID, False)
+
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    frames = sum(ws.frames for ws in sockets)
+    return {
+        "mode": "batched" if batched else "immediate",
+        "frames": frames,
+        "frames_per_s": round(frames / elapsed),
+        "events_per_s": round(members * messages / elapsed),
+        "latency_p50_ms": round(statistics.median(latencies_ms), 3),
+        "latency_p99_ms": round(latencies_ms[int(len(latencies_ms) * 0.99) - 1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--members", type=int, default=200, help="sockets subscribed to the channel")
+    parser.add_argument("--messages", type=int, default=2000, help="events published to the channel")
+    parser.add_argument("--burst", type=int, default=20, help="events published between yields to the loop")
+    args = parser.parse_args()
+
+    for batched in (False, True):
+        print(asyncio.run(run(args.members, args.messages, args.burst, batched)))
+
+
+if __name__ == "__main__":
+    main()
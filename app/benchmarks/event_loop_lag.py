@@ -0,0 +1,98 @@
+"""Event-loop lag while SQLite writes run inline vs on the DB executor.
+
+Run from the repository root:
+
+    python -m app.benchmarks.event_loop_lag --writers 8 --writes 50
+
+A ticker task sleeps for a fixed interval and records how late it wakes
+up; that lateness is what every open WebSocket on the loop experiences.
+The same burst of concurrent commits is run twice against a scratch
+database, once calling the session directly from the coroutine (as the
+handlers used to) and once through run_db().
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.backend import database
+from app.backend.base import Base
+from app.backend.models import ChannelMessage
+
+TICK_SECONDS = 0.001
+
+
+def make_session_factory(path: str):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def write_one(session_factory, n: int):
+    db = session_factory()
+    try:
+        db.add(ChannelMessage(channel_id=1, sender_id=1, text=f"benchmark {n}"))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def ticker(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK_SECONDS)
+        lags.append(time.perf_counter() - started - TICK_SECONDS)
+
+
+async def writer(session_factory, writes: int, offload: bool):
+    for n in range(writes):
+        if offload:
+            await database.run_db(write_one, session_factory, n)
+        else:
+            write_one(session_factory, n)
+            await asyncio.sleep(0)
+
+
+async def measure(session_factory, writers: int, writes: int, offload: bool) -> dict:
+    lags, stop = [], asyncio.Event()
+    tick = asyncio.create_task(ticker(lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(writer(session_factory, writes, offload) for _ in range(writers)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await tick
+
+    lags_ms = sorted(lag * 1000 for lag in lags) or [0.0]
+    return {
+        "mode": "run_db" if offload else "inline",
+        "writes_per_s": round(writers * writes / elapsed, 1),
+        "lag_p50_ms": round(statistics.median(lags_ms), 3),
+        "lag_p99_ms": round(lags_ms[min(len(lags_ms) - 1, int(len(lags_ms) * 0.99))], 3),
+        "lag_max_ms": round(lags_ms[-1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=8, help="concurrent writer coroutines")
+    parser.add_argument("--writes", type=int, default=50, help="commits per writer")
+    parser.add_argument("--db-workers", type=int, default=database.DB_EXECUTOR_WORKERS,
+                        help="size of the DB executor")
+    args = parser.parse_args()
+
+    database.db_executor = ThreadPoolExecutor(max_workers=args.db_workers, thread_name_prefix="db")
+    with tempfile.TemporaryDirectory() as directory:
+        engine, session_factory = make_session_factory(os.path.join(directory, "bench.db"))
+        for offload in (False, True):
+            print(asyncio.run(measure(session_factory, args.writers, args.writes, offload)))
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -23,10 +23,7 @@ export function connectWebSocket(userId) {
   if (!isListening) {
     const messageStore = useDirectMessageStore();
 
-    socket.addEventListener("message", (event) => {
-      try {
-        const message = JSON.parse(event.data);
-
+    const handleMessage = (message) => {
         if (message.action === "message_deleted") {
 
           if (message.type === "direct") {
@@ -49,6 +46,25 @@ export function connectWebSocket(userId) {
         } else if (message.receiver_id) {
           messageStore.receiveMessage(message);
         }
+    };
+
+    socket.addEventListener("message", (event) => {
+      try {
+        const message = JSON.parse(event.data);
+
+        // answer server heartbeats so the connection is not reaped as idle
+        if (message.type === "ping") {
+          socket.send(JSON.stringify({ type: "pong" }));
+          return;
+        }
+
+        // busy channels deliver several events in one frame
+        if (message.type === "batch") {
+          message.events.forEach(handleMessage);
+          return;
+        }
+
+        handleMessage(message);
 
       } catch (error) {
         console.error("[ERROR] Failed to parse WebSocket message:", error);
@@ -91,6 +107,10 @@ export function onDirectMessage(callback) {
     socket.onmessage = (event) => {
         try {
             const message = JSON.parse(event.data);
+            if (message.type === "ping") {
+                socket.send(JSON.stringify({ type: "pong" }));
+                return;
+            }
             callback(message);
         } catch (error) {
             console.error("[ERROR] Failed to parse WebSocket message:", error);
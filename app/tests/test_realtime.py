@@ -0,0 +1,276 @@
+import time
+import uuid
+
+import pytest
+from fastapi import WebSocketDisconnect
+from fastapi.testclient import TestClient
+
+from app.backend import api, codec
+from app.backend.api import app
+from app.backend.connections import IDLE_TIMEOUT
+from app.backend.database import SessionLocal, init_db
+from app.backend.models import User, Channel, ChannelMessage, UserChannel
+
+client = TestClient(app)
+
+
+def wait_for(predicate, timeout=2.0):
+    """waits for the server side of a socket to finish registering"""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+# ensure tables exist without wiping data other test modules rely on
+init_db()
+
+
+@pytest.fixture(scope="function")
+def member_and_outsider():
+    """creates a channel with one member and one user who never joined it"""
+    suffix = uuid.uuid4().hex[:8]
+    db = SessionLocal()
+    try:
+        member = User(username=f"member_{suffix}", password_hash="pass")
+        outsider = User(username=f"outsider_{suffix}", password_hash="pass")
+        channel = Channel(name=f"realtime_{suffix}", is_public=True)
+        db.add_all([member, outsider, channel])
+        db.commit()
+        db.add(UserChannel(user_id=member.id, channel_id=channel.id))
+        db.commit()
+        yield member.id, outsider.id, channel.id
+    finally:
+        db.close()
+
+
+def test_channel_fanout_only_reaches_members(member_and_outsider):
+    """channel messages on the direct socket go to members, not every connected user"""
+    member_id, outsider_id, channel_id = member_and_outsider
+
+    with client.websocket_connect(f"/realtime/direct/{member_id}") as member_ws, \
+            client.websocket_connect(f"/realtime/direct/{outsider_id}"):
+        wait_for(lambda: member_id in api.manager.users)
+        wait_for(lambda: outsider_id in api.manager.users)
+        assert len(api.manager.channels[channel_id]) == 1
+
+        member_ws.send_json({"type": "channel", "channel_id": channel_id, "content": "hi members"})
+        response = member_ws.receive_json()
+        assert response["channel_id"] == channel_id
+        assert response["text"] == "hi members"
+
+    wait_for(lambda: channel_id not in api.manager.channels)
+
+
+def test_subscribe_updates_open_sockets(member_and_outsider):
+    """subscribing and unsubscribing keeps the index in sync with connected sockets"""
+    _member_id, outsider_id, channel_id = member_and_outsider
+
+    with client.websocket_connect(f"/realtime/direct/{outsider_id}"):
+        wait_for(lambda: outsider_id in api.manager.users)
+        assert channel_id not in api.manager.channels
+
+        client.post(f"/subscribe/{outsider_id}/{channel_id}")
+        assert len(api.manager.channels[channel_id]) == 1
+
+        client.delete(f"/unsubscribe/{outsider_id}/{channel_id}")
+        assert channel_id not in api.manager.channels
+
+
+class ClosedConnection:
+    """stands in for a Connection whose socket is already gone"""
+    kind = "global"
+    key = None
+    websocket = None
+
+    def send(self, payload):
+        return False
+
+
+def test_deliver_local_drops_closed_connections():
+    """a connection that refuses a frame is removed from its registry"""
+    closed = ClosedConnection()
+    api.manager.global_listeners.add(closed)
+
+    api.publish({"event": "channel_created"}, ("global", None))
+
+    assert closed not in api.manager.global_listeners
+
+
+def test_realtime_stats_reports_open_sockets(member_and_outsider):
+    """GET /realtime/stats lists each connected socket with its queue depth"""
+    member_id, _outsider_id, channel_id = member_and_outsider
+
+    with client.websocket_connect(f"/realtime/direct/{member_id}"), \
+            client.websocket_connect(f"/realtime/channel/{channel_id}/{member_id}"):
+        wait_for(lambda: member_id in api.manager.users)
+        wait_for(lambda: len(api.manager.channels.get(channel_id, ())) == 2)
+
+        stats = client.get("/realtime/stats").json()
+        ours = {(entry["kind"], entry["key"]) for entry in stats["per_connection"]}
+        assert ("direct", member_id) in ours
+        assert ("channel", channel_id) in ours
+        assert stats["sockets_per_channel"][str(channel_id)] == 2
+        assert all(entry["queue_depth"] <= entry["queue_capacity"] for entry in stats["per_connection"])
+
+    wait_for(lambda: ("channel", channel_id) not in {
+        (entry["kind"], entry["key"]) for entry in client.get("/realtime/stats").json()["per_connection"]
+    })
+
+
+def test_non_member_cannot_post_to_channel(member_and_outsider):
+    """channel messages from users outside the channel are rejected and not stored"""
+    _member_id, outsider_id, channel_id = member_and_outsider
+
+    with client.websocket_connect(f"/realtime/direct/{outsider_id}") as outsider_ws:
+        outsider_ws.send_json({"type": "channel", "channel_id": channel_id, "content": "let me in"})
+        response = outsider_ws.receive_json()
+        assert response["error"] == "Not a member of this channel."
+
+    db = SessionLocal()
+    try:
+        assert db.query(ChannelMessage).filter_by(channel_id=channel_id).count() == 0
+    finally:
+        db.close()
+
+
+@pytest.mark.skipif(codec.msgpack is None, reason="msgpack is not installed")
+def test_msgpack_clients_get_binary_frames(member_and_outsider):
+    """a socket opened with ?format=msgpack sends and receives MessagePack frames"""
+    member_id, _outsider_id, channel_id = member_and_outsider
+
+    with client.websocket_connect(f"/realtime/direct/{member_id}?format=msgpack") as member_ws:
+        wait_for(lambda: member_id in api.manager.users)
+        member_ws.send_bytes(codec.msgpack.packb({"type": "channel", "channel_id": channel_id, "content": "packed"}))
+        response = codec.msgpack.unpackb(member_ws.receive_bytes())
+        assert response["channel_id"] == channel_id
+        assert response["text"] == "packed"
+
+
+def test_history_is_served_from_hot_tier(member_and_outsider):
+    """history reads after the first come from memory and reflect deletions"""
+    member_id, _outsider_id, channel_id = member_and_outsider
+    db = SessionLocal()
+    admin = User(username=f"admin_{uuid.uuid4().hex[:8]}", password_hash="pass", is_admin=True)
+    db.add(admin)
+    db.commit()
+    admin_id = admin.id
+    db.close()
+
+    first = client.post("/channel-messages/", json={"channel_id": channel_id, "sender_id": member_id, "text": "one"})
+    second = client.post("/channel-messages/", json={"channel_id": channel_id, "sender_id": member_id, "text": "two"})
+    assert [m["text"] for m in client.get(f"/channel-messages/{channel_id}").json()] == ["one", "two"]
+
+    hits = api.hot_tier.hits
+    client.delete(f"/channel-messages/{first.json()['id']}", headers={"User-id": str(admin_id)})
+    assert [m["id"] for m in client.get(f"/channel-messages/{channel_id}").json()] == [second.json()["id"]]
+    assert client.get(f"/channel-messages/{channel_id}", params={"after": second.json()["id"]}).json() == []
+    assert api.hot_tier.hits == hits + 2
+
+
+def test_idle_sockets_are_reaped(member_and_outsider):
+    """pongs keep a socket alive; a socket silent past the idle timeout is closed and deregistered"""
+    member_id, _outsider_id, channel_id = member_and_outsider
+
+    with client.websocket_connect(f"/realtime/channel/{channel_id}/{member_id}") as ws:
+        wait_for(lambda: channel_id in api.manager.channels)
+        conn = next(iter(api.manager.channels[channel_id]))
+
+        ws.send_json({"type": "pong"})
+        wait_for(lambda: conn.last_seen > time.monotonic() - 1)
+
+        reaped = api.manager.stats()["reaped"]
+        conn.last_seen -= IDLE_TIMEOUT + 1
+        api.manager.sweep()
+
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+        assert closed.value.code == 1001
+        assert channel_id not in api.manager.channels
+        assert api.manager.stats()["reaped"] == reaped + 1
+
+
+def test_multiplexed_socket_carries_every_stream(member_and_outsider):
+    """one mux socket receives subscribed channel messages, direct messages and channel-list events"""
+    member_id, outsider_id, channel_id = member_and_outsider
+
+    with client.websocket_connect(f"/realtime/mux/{outsider_id}") as mux_ws, \
+            client.websocket_connect(f"/realtime/direct/{member_id}") as member_ws:
+        wait_for(lambda: outsider_id in api.manager.users and member_id in api.manager.users)
+
+        mux_ws.send_json({"type": "subscribe", "channel_id": channel_id})
+        assert mux_ws.receive_json() == {"type": "subscribed", "channel_id": channel_id}
+
+        member_ws.send_json({"type": "channel", "channel_id": channel_id, "content": "to subscribers"})
+        assert mux_ws.receive_json()["text"] == "to subscribers"
+        member_ws.receive_json()
+
+        # subscribing does not make the outsider a member
+        mux_ws.send_json({"type": "channel", "channel_id": channel_id, "content": "sneaky"})
+        assert mux_ws.receive_json()["error"] == "Not a member of this channel."
+
+        member_ws.send_json({"type": "direct", "receiver_id": outsider_id, "content": "psst"})
+        assert mux_ws.receive_json()["content"] == "psst"
+        member_ws.receive_json()
+
+        api.publish({"event": "channel_created"}, ("global", None))
+        assert mux_ws.receive_json() == {"event": "channel_created"}
+
+        mux_ws.send_json({"type": "unsubscribe", "channel_id": channel_id})
+        assert mux_ws.receive_json() == {"type": "unsubscribed", "channel_id": channel_id}
+        assert [conn.kind for conn in api.manager.recipients([("channel", channel_id)])] == ["direct"]
+
+
+def test_batched_channel_sends_one_frame(member_and_outsider):
+    """a multi-message frame to a batched channel is stored together and delivered as one array frame"""
+    member_id, _outsider_id, channel_id = member_and_outsider
+    api.batcher.set_mode(channel_id, batched=True)
+
+    try:
+        with client.websocket_connect(f"/realtime/direct/{member_id}") as member_ws:
+            wait_for(lambda: member_id in api.manager.users)
+            member_ws.send_json({"type": "channel_batch", "channel_id": channel_id, "messages": ["a", "b", "c"]})
+
+            frame = member_ws.receive_json()
+            assert frame["type"] == "batch"
+            assert [event["text"] for event in frame["events"]] == ["a", "b", "c"]
+    finally:
+        api.batcher.set_mode(channel_id, batched=False)
+
+
+@pytest.fixture(scope="function")
+def admin_id():
+    db = SessionLocal()
+    try:
+        admin = User(username=f"admin_{uuid.uuid4().hex[:8]}", password_hash="pass", is_admin=True)
+        db.add(admin)
+        db.commit()
+        yield admin.id
+    finally:
+        db.close()
+
+
+def test_channel_list_diffs_and_resync(admin_id):
+    """a burst of channel changes arrives as one diff, and a reconnect replays only what was missed"""
+    headers = {"User-id": str(admin_id)}
+    with TestClient(app) as live_client:  # runs lifespan so diffs are flushed on the app loop
+        with live_client.websocket_connect("/realtime/global/channels?since=-1") as ws:
+            snapshot = ws.receive_json()
+            assert snapshot["event"] == "channels_snapshot"
+
+            first = live_client.post("/channels/", json={"name": f"diff_{uuid.uuid4().hex[:8]}"}, headers=headers)
+            second = live_client.post("/channels/", json={"name": f"diff_{uuid.uuid4().hex[:8]}"}, headers=headers)
+            live_client.delete(f"/delete_channel/{first.json()['id']}", headers=headers)
+
+            diff = ws.receive_json()
+            assert diff["event"] == "channels_diff"
+            assert diff["from_version"] == snapshot["version"]
+            assert [channel["id"] for channel in diff["added"]] == [second.json()["id"]]
+            assert diff["removed"] == [first.json()["id"]]
+
+        with live_client.websocket_connect(f"/realtime/global/channels?since={snapshot['version'] + 2}") as ws:
+            replay = ws.receive_json()
+            assert (replay["from_version"], replay["version"]) == (snapshot["version"] + 2, diff["version"])
+            assert replay["added"] == [] and replay["removed"] == [first.json()["id"]]
+
+        live_client.delete(f"/delete_channel/{second.json()['id']}", headers=headers)
@@ -0,0 +1,103 @@
+import os
+import socket
+import threading
+
+import pytest
+
+from app.backend import backplane as backplane_module
+from app.backend.backplane import InProcessBackplane, UnixSocketBackplane
+
+unix_only = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix domain sockets")
+
+
+class Recorder:
+    """Collects delivered events and signals when the expected number has arrived."""
+
+    def __init__(self, expected=1):
+        self.events = []
+        self.expected = expected
+        self.done = threading.Event()
+
+    def __call__(self, event):
+        self.events.append(event)
+        if len(self.events) >= self.expected:
+            self.done.set()
+
+
+def test_inprocess_delivers_to_local_handler():
+    """
+    The in-process backplane hands each event straight to its handler.
+    """
+    received = Recorder()
+    plane = InProcessBackplane(received)
+
+    plane.publish({"targets": [["user", 1]], "payload": {"text": "hi"}})
+
+    assert received.events == [{"targets": [["user", 1]], "payload": {"text": "hi"}}]
+
+
+@unix_only
+def test_unix_publish_reaches_peer_once(tmp_path):
+    """
+    An event published by one worker reaches the other worker's handler exactly once,
+    and the publisher still delivers it locally.
+    """
+    first_events, second_events = Recorder(), Recorder()
+    first = UnixSocketBackplane(first_events, directory=str(tmp_path), name="first")
+    second = UnixSocketBackplane(second_events, directory=str(tmp_path), name="second")
+    first.start()
+    second.start()
+
+    try:
+        event = {"targets": [["channel", 7]], "payload": {"text": "across workers"}}
+        first.publish(event)
+
+        assert second_events.done.wait(timeout=2)
+        second.stop()  # joins the listener, so no late duplicate can slip in
+        assert second_events.events == [event]
+        assert first_events.events == [event]
+    finally:
+        first.stop()
+        second.stop()
+
+
+@unix_only
+def test_unix_forgets_stale_socket(tmp_path):
+    """
+    A socket file left behind by a dead worker is removed on the first refused send.
+    """
+    stale_path = tmp_path / "dead.sock"
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    stale.bind(str(stale_path))
+    stale.close()  # the file stays but nothing is listening
+
+    plane = UnixSocketBackplane(Recorder(), directory=str(tmp_path), name="alive")
+    plane.start()
+    try:
+        plane.publish({"targets": [], "payload": "ping"})
+        assert not stale_path.exists()
+        assert str(stale_path) not in plane.peers
+    finally:
+        plane.stop()
+
+
+@unix_only
+def test_unix_oversized_event_stays_local(tmp_path, monkeypatch):
+    """
+    Events over MAX_EVENT_BYTES are delivered locally but never sent to peers.
+    """
+    monkeypatch.setattr(backplane_module, "MAX_EVENT_BYTES", 64)
+    first_events, second_events = Recorder(), Recorder()
+    first = UnixSocketBackplane(first_events, directory=str(tmp_path), name="first")
+    second = UnixSocketBackplane(second_events, directory=str(tmp_path), name="second")
+    first.start()
+    second.start()
+
+    try:
+        first.publish({"targets": [], "payload": "x" * 200})
+        assert len(first_events.events) == 1
+        assert not second_events.done.wait(timeout=0.2)
+    finally:
+        first.stop()
+        second.stop()
+    assert not os.path.exists(first.path)
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from app.backend.batching import ChannelBatcher
+
+
+class Sink:
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, channel_id, payloads):
+        self.batches.append((channel_id, payloads))
+
+
+@pytest.mark.asyncio
+async def test_events_within_window_share_one_batch():
+    """
+    Events added inside the flush window are delivered in a single call.
+    """
+    sink = Sink()
+    batcher = ChannelBatcher(sink, window_ms=20, max_events=10, channels={1})
+
+    for n in range(3):
+        batcher.add(1, {"n": n})
+    assert sink.batches == []
+
+    await asyncio.sleep(0.05)
+    assert sink.batches == [(1, [{"n": 0}, {"n": 1}, {"n": 2}])]
+
+
+@pytest.mark.asyncio
+async def test_full_batch_flushes_early():
+    """
+    Reaching max_events sends the batch without waiting for the window.
+    """
+    sink = Sink()
+    batcher = ChannelBatcher(sink, window_ms=1000, max_events=2, channels={1})
+
+    for n in range(5):
+        batcher.add(1, n)
+
+    assert sink.batches == [(1, [0, 1]), (1, [2, 3])]
+    batcher.set_mode(1, batched=False)
+    assert sink.batches[-1] == (1, [4])
+    assert not batcher.is_batched(1)
+
+
+def test_without_a_loop_events_go_out_at_once():
+    """
+    Sync callers have no loop to wait on, so each event is flushed immediately.
+    """
+    sink = Sink()
+    batcher = ChannelBatcher(sink, channels={1})
+
+    batcher.add(1, "a")
+
+    assert sink.batches == [(1, ["a"])]
+    assert batcher.stats()["batches"] == 1
@@ -0,0 +1,65 @@
+from app.backend.cache import HotTier, channel_key, direct_key
+
+
+def channel_row(message_id, channel_id=1, text="hi"):
+    return {"id": message_id, "channel_id": channel_id, "sender_id": 1, "text": text, "timestamp": None}
+
+
+def test_full_history_needs_a_database_load():
+    """
+    A buffer started by a write only covers later messages until history is loaded.
+    """
+    tier = HotTier(per_key=10)
+    tier.append(channel_row(5))
+
+    assert tier.recent(channel_key(1)) is None
+    assert [row["id"] for row in tier.recent(channel_key(1), after=4)] == [5]
+
+    tier.load(channel_key(1), [channel_row(2), channel_row(3)])
+    assert [row["id"] for row in tier.recent(channel_key(1))] == [2, 3, 5]
+
+
+def test_buffer_keeps_the_most_recent_rows():
+    """
+    Past per_key rows the oldest are dropped and replays from before them miss.
+    """
+    tier = HotTier(per_key=3)
+    tier.load(channel_key(1), [channel_row(i) for i in range(1, 6)])
+
+    assert tier.recent(channel_key(1)) is None
+    assert tier.recent(channel_key(1), after=1) is None
+    assert [row["id"] for row in tier.recent(channel_key(1), after=2)] == [3, 4, 5]
+
+    tier.append(channel_row(6))
+    assert [row["id"] for row in tier.recent(channel_key(1), after=3)] == [4, 5, 6]
+
+
+def test_duplicate_appends_and_removals():
+    """
+    Replayed appends are ignored and deletions disappear from reads.
+    """
+    tier = HotTier(per_key=10)
+    tier.load(direct_key(2, 1), [])
+    row = {"id": 7, "sender_id": 1, "receiver_id": 2, "text": "dm", "timestamp": None}
+    tier.append(row)
+    tier.append(row)
+
+    assert [r["id"] for r in tier.recent(direct_key(1, 2))] == [7]
+    tier.remove(direct_key(1, 2), 7)
+    assert tier.recent(direct_key(1, 2)) == []
+
+
+def test_least_recently_used_keys_are_evicted_first():
+    """
+    Once over the byte cap, the key read or written longest ago is dropped.
+    """
+    tier = HotTier(per_key=10, max_bytes=700)
+    for channel_id in (1, 2, 3):
+        tier.load(channel_key(channel_id), [channel_row(channel_id, channel_id)])
+    tier.recent(channel_key(1))
+
+    tier.load(channel_key(4), [channel_row(4, 4)])
+
+    assert tier.recent(channel_key(2)) is None
+    assert tier.recent(channel_key(1)) is not None
+    assert tier.stats()["bytes"] <= 700
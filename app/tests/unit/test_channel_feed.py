@@ -0,0 +1,33 @@
+from app.backend.channel_feed import coalesce
+
+
+def created(version, channel_id):
+    return {"version": version, "action": "created", "channel_id": channel_id,
+            "channel": {"id": channel_id, "name": f"c{channel_id}", "is_public": True}}
+
+
+def deleted(version, channel_id):
+    return {"version": version, "action": "deleted", "channel_id": channel_id}
+
+
+def test_burst_collapses_to_net_changes():
+    """
+    A channel created and deleted within one burst does not appear as added.
+    """
+    diff = coalesce([created(5, 1), created(6, 2), deleted(7, 1), deleted(8, 3)])
+
+    assert diff["from_version"] == 4
+    assert diff["version"] == 8
+    assert [channel["id"] for channel in diff["added"]] == [2]
+    assert diff["removed"] == [1, 3]
+
+
+def test_changes_are_ordered_by_version():
+    """
+    Changes that arrive out of order, e.g. from several workers, are applied by version.
+    """
+    diff = coalesce([created(11, 4), deleted(10, 4)])
+
+    assert (diff["from_version"], diff["version"]) == (9, 11)
+    assert [channel["id"] for channel in diff["added"]] == [4]
+    assert diff["removed"] == [4]
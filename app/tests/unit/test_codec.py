@@ -0,0 +1,56 @@
+import pytest
+
+from app.backend import codec
+from app.backend.codec import ChannelFrame, DirectFrame, Frame, decode, realtime_frame
+
+needs_msgpack = pytest.mark.skipif(codec.msgpack is None, reason="msgpack is not installed")
+
+
+def test_frame_encodes_once_per_format(monkeypatch):
+    """
+    A broadcast frame is serialized once no matter how many sockets send it.
+    """
+    calls = []
+    real_encode = codec.encode
+    monkeypatch.setattr(codec, "encode", lambda payload, fmt: calls.append(fmt) or real_encode(payload, fmt))
+
+    frame = Frame({"channel_id": 1, "text": "hello"})
+    encoded = {frame.encode("json") for _ in range(50)}
+
+    assert encoded == {'{"channel_id":1,"text":"hello"}'}
+    assert calls == ["json"]
+
+
+def test_realtime_frames_default_to_direct():
+    """
+    Frames without a type are direct messages; channel frames accept the legacy field names.
+    """
+    direct = decode(realtime_frame, '{"receiver_id": 2, "content": "hi"}')
+    legacy = decode(realtime_frame, '{"type": "channel", "receiver_id": 4, "text": "yo"}')
+
+    assert isinstance(direct, DirectFrame) and direct.receiver_id == 2
+    assert isinstance(legacy, ChannelFrame)
+    assert (legacy.channel_id, legacy.content) == (4, "yo")
+
+
+@pytest.mark.parametrize("data", [
+    "not json",
+    '{"type": "direct", "content": "no receiver"}',
+    '{"type": "channel", "content": "no channel"}',
+    '{"type": "video", "receiver_id": 1}',
+])
+def test_malformed_frames_raise_value_error(data):
+    with pytest.raises(ValueError):
+        decode(realtime_frame, data)
+
+
+@needs_msgpack
+def test_msgpack_round_trip():
+    """
+    MessagePack clients get binary frames and may send binary frames back.
+    """
+    frame = Frame({"type": "direct", "receiver_id": 3, "content": "packed"})
+    data = frame.encode("msgpack")
+
+    assert isinstance(data, bytes)
+    assert decode(realtime_frame, data, "msgpack") == DirectFrame(receiver_id=3, content="packed")
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from app.backend.connections import HEARTBEAT_INTERVAL, IDLE_TIMEOUT, Connection, ConnectionManager, connection_stats
+
+
+class StalledWebSocket:
+    """Fake socket whose sends block until released, like a client that stopped reading."""
+
+    def __init__(self):
+        self.sent = []
+        self.released = asyncio.Event()
+        self.close_code = None
+
+    async def send_json(self, data):
+        await self.released.wait()
+        self.sent.append(data)
+
+    async def send_text(self, data):
+        await self.send_json(json.loads(data))
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+
+@pytest.mark.asyncio
+async def test_send_does_not_wait_for_slow_consumer():
+    """
+    send() returns immediately even when the socket is stalled,
+    and frames are delivered in order once it drains.
+    """
+    ws = StalledWebSocket()
+    conn = Connection(ws, kind="direct", key=1, max_queue=10)
+
+    for i in range(5):
+        assert conn.send({"n": i})
+    await asyncio.sleep(0)
+    assert ws.sent == []
+
+    ws.released.set()
+    await asyncio.sleep(0.01)
+    assert [frame["n"] for frame in ws.sent] == [0, 1, 2, 3, 4]
+    assert conn.stats()["sent"] == 5
+
+    await conn.close()
+
+
+@pytest.mark.asyncio
+async def test_drop_policy_discards_overflow():
+    """
+    With the drop policy, frames beyond the queue capacity are counted and discarded.
+    """
+    ws = StalledWebSocket()
+    conn = Connection(ws, kind="direct", key=2, max_queue=2, overflow_policy="drop")
+
+    for i in range(6):
+        conn.send({"n": i})
+    await asyncio.sleep(0)
+
+    stats = conn.stats()
+    assert stats["dropped"] > 0
+    assert stats["queue_depth"] <= 2
+    assert not conn.closed
+
+    await conn.close()
+
+
+@pytest.mark.asyncio
+async def test_disconnect_policy_evicts_slow_consumer():
+    """
+    With the disconnect policy, an overflowing consumer is closed and removed from stats.
+    """
+    ws = StalledWebSocket()
+    conn = Connection(ws, kind="direct", key=3, max_queue=1, overflow_policy="disconnect")
+
+    for i in range(5):
+        conn.send({"n": i})
+    await asyncio.sleep(0.01)
+
+    assert conn.closed
+    assert ws.close_code == 1013
+    assert not conn.send({"n": 99})
+    assert all(entry["key"] != 3 for entry in connection_stats()["per_connection"])
+
+
+class FakeConnection:
+    """Just enough of a Connection for registry bookkeeping."""
+
+    def __init__(self, kind, key):
+        self.kind = kind
+        self.key = key
+        self.websocket = object()
+        self.closed = False
+        self.last_seen = time.monotonic()
+        self.sent = []
+
+    def send(self, payload):
+        self.sent.append(payload)
+        return True
+
+    def reap(self):
+        self.closed = True
+
+
+def test_manager_keeps_user_and_channel_ids_apart():
+    """
+    User 5's personal socket and channel 5's socket land in separate indexes.
+    """
+    manager = ConnectionManager()
+    user_conn = FakeConnection("direct", 5)
+    channel_conn = FakeConnection("channel", 5)
+
+    manager.connect_user(user_conn, 5, channel_ids=[9])
+    manager.connect_channel(channel_conn, 5)
+
+    assert manager.recipients([("user", 5)]) == {user_conn}
+    assert manager.recipients([("channel", 5)]) == {channel_conn}
+    assert manager.recipients([("channel", 9), ("user", 5)]) == {user_conn}
+
+
+def test_manager_subscription_changes_and_cleanup():
+    """
+    subscribe/unsubscribe follow membership and disconnect empties every index.
+    """
+    manager = ConnectionManager()
+    conn = FakeConnection("direct", 1)
+    manager.connect_user(conn, 1)
+
+    manager.subscribe(1, 3)
+    assert manager.is_subscribed(conn, 3)
+    assert manager.stats()["sockets_per_channel"] == {3: 1}
+
+    manager.unsubscribe(1, 3)
+    assert not manager.is_subscribed(conn, 3)
+
+    manager.subscribe(1, 4)
+    manager.disconnect(conn)
+    manager.disconnect(conn)
+    assert manager.stats() == {
+        "connections": 0, "users": 0, "channels": 0, "global_listeners": 0, "reaped": 0,
+        "sockets_per_channel": {},
+    }
+
+
+def test_sweep_pings_quiet_sockets_and_reaps_idle_ones():
+    """
+    Quiet sockets get a ping, silent or dead ones are reaped and deregistered.
+    """
+    manager = ConnectionManager()
+    busy, quiet, idle, dead = (FakeConnection("direct", key) for key in (1, 2, 3, 4))
+    for conn in (busy, quiet, idle, dead):
+        manager.connect_user(conn, conn.key, channel_ids=[7])
+    now = time.monotonic()
+    quiet.last_seen = now - HEARTBEAT_INTERVAL
+    idle.last_seen = now - IDLE_TIMEOUT - 1
+    dead.closed = True
+
+    assert manager.sweep(now) == 2
+
+    assert busy.sent == [] and quiet.sent == [{"type": "ping"}]
+    assert idle.closed
+    assert manager.recipients([("channel", 7)]) == {busy, quiet}
+    assert manager.stats()["reaped"] == 2
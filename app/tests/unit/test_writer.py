@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.backend.base import Base
+from app.backend.models import User, Channel, ChannelMessage, DirectMessage
+from app.backend.writer import MessageWriter
+
+
+@pytest.fixture(scope="function")
+def session_factory(tmp_path):
+    """
+    File-backed database so the writer thread and the test share the same data.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'writer.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    db = factory()
+    db.add_all([User(id=1, username="alice", password_hash="x"), User(id=2, username="bob", password_hash="x"),
+                Channel(id=1, name="general")])
+    db.commit()
+    db.close()
+
+    yield factory
+    engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_burst_is_committed_in_few_transactions(session_factory):
+    """
+    Concurrent submissions share transactions and every sender gets its own row back.
+    """
+    writer = MessageWriter(session_factory, flush_window_ms=20, max_batch=100)
+    try:
+        results = await asyncio.gather(*[
+            writer.submit(ChannelMessage(channel_id=1, sender_id=1, text=f"msg {i}")) for i in range(50)
+        ])
+    finally:
+        writer.stop()
+
+    assert [row["text"] for row in results] == [f"msg {i}" for i in range(50)]
+    assert len({row["id"] for row in results}) == 50
+
+    stats = writer.stats()
+    assert stats["messages"] == 50
+    assert stats["flushes"] < 50
+    assert stats["largest_batch"] > 1
+
+    db = session_factory()
+    assert db.query(ChannelMessage).count() == 50
+    db.close()
+
+
+@pytest.mark.asyncio
+async def test_batch_size_caps_transactions(session_factory):
+    """
+    No transaction holds more than max_batch messages.
+    """
+    writer = MessageWriter(session_factory, flush_window_ms=50, max_batch=4)
+    try:
+        await asyncio.gather(*[
+            writer.submit(DirectMessage(sender_id=1, receiver_id=2, text=str(i))) for i in range(10)
+        ])
+    finally:
+        writer.stop()
+
+    assert writer.stats()["largest_batch"] <= 4
+    assert writer.stats()["flushes"] >= 3
+
+
+@pytest.mark.asyncio
+async def test_failed_submission_does_not_fail_its_batch(session_factory):
+    """
+    A row that cannot be inserted fails only its own submitter.
+    """
+    writer = MessageWriter(session_factory, flush_window_ms=20, max_batch=100)
+    try:
+        good, bad = await asyncio.gather(
+            writer.submit(ChannelMessage(channel_id=1, sender_id=1, text="fine")),
+            writer.submit(ChannelMessage(channel_id=1, sender_id=1, text=None)),
+            return_exceptions=True,
+        )
+    finally:
+        writer.stop()
+
+    assert good["text"] == "fine"
+    assert isinstance(bad, Exception)